@@ -0,0 +1,42 @@
+import hashlib
+import os
+from functools import lru_cache
+
+from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
+
+APP_DIR = os.path.dirname(__file__)
+STATIC_DIR = os.path.join(APP_DIR, "static")
+TEMPLATES_DIR = os.path.join(APP_DIR, "templates")
+STATIC_PATH = "/static"
+
+# Versioned asset URLs change whenever the file does, so they never need revalidating
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+@lru_cache(maxsize=None)
+def asset_url(name: str) -> str:
+    """URL of a static file, versioned by a hash of its contents"""
+    with open(os.path.join(STATIC_DIR, name), "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    return f"{STATIC_PATH}/{name}?v={digest}"
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles that lets browsers keep versioned assets forever
+
+    Requests carrying the ``v`` query parameter from ``asset_url`` are marked
+    immutable; unversioned requests must revalidate with the ETag.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if b"v=" in scope.get("query_string", b""):
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+
+templates = Jinja2Templates(directory=TEMPLATES_DIR)
+templates.env.globals["asset_url"] = asset_url
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Hashable, List, Optional
+
+
+@dataclass
+class LeaderboardPage:
+    """A cached first page of the claimed leaderboard"""
+    limit: int
+    rows: List[Any]
+    payload: Any = None
+    # The payload serialized once at load time; every hit sends these bytes as-is
+    body: bytes = b""
+    snapshot_at: Optional[datetime] = None
+    # What the page was built from, for ETag validation (a conditional.Version)
+    version: Any = None
+
+    def admits(self, total_savings: int) -> bool:
+        """Whether a newly claimed score with these savings would appear on this page"""
+        if len(self.rows) < self.limit:
+            return True
+        return total_savings >= self.rows[-1]['total_savings']
+
+
+@dataclass
+class _Entry:
+    value: Any
+    expires_at: float
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    coalesced: int = 0
+    loads: int = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class LeaderboardCache:
+    """Short-TTL, single-flight cache for leaderboard pages
+
+    Concurrent misses for the same key share one in-flight load, so a burst of
+    identical requests costs a single database query. Entries are dropped when
+    they expire, when the cache is full (least recently used first), or when a
+    write makes them stale.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 64):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        # Keyed by (key, generation): after an invalidation, callers start a
+        # fresh load instead of joining one that may predate the write
+        self._inflight: dict = {}
+        # Bumped on every invalidation so loads that started before a write
+        # don't repopulate the cache with pre-write data
+        self._generation = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        """Return the cached value for key, loading it at most once concurrently"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return entry.value
+            self._evict(key)
+
+        self.stats.misses += 1
+        flight = (key, self._generation)
+        task = self._inflight.get(flight)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, self._generation, loader))
+            # Retrieve the result even if every waiter has gone away
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[flight] = task
+        else:
+            self.stats.coalesced += 1
+        # Shielded so a disconnecting client doesn't cancel the shared load
+        return await asyncio.shield(task)
+
+    def invalidate(self, predicate: Callable[[Any], bool] = None):
+        """Drop every entry, or only those whose value matches predicate
+
+        Loads already in flight are not stored or shared with later callers,
+        whatever the predicate, since what they read is unknown until they finish.
+        """
+        self._generation += 1
+        for key in [k for k, e in self._entries.items() if predicate is None or predicate(e.value)]:
+            self._evict(key)
+
+    def clear(self):
+        self.invalidate()
+
+    def snapshot(self) -> dict:
+        """Counters and size for diagnostics"""
+        stats = self.stats.as_dict()
+        lookups = stats['hits'] + stats['misses']
+        stats['size'] = len(self._entries)
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        return stats
+
+    async def _load(self, key: Hashable, generation: int, loader: Callable[[], Awaitable[Any]]):
+        # The generation at the miss, not when the task first runs: an
+        # invalidation in between means this load may predate the write
+        self.stats.loads += 1
+        try:
+            value = await loader()
+        finally:
+            del self._inflight[(key, generation)]
+        if generation == self._generation:
+            self._store(key, value)
+        return value
+
+    def _store(self, key: Hashable, value: Any):
+        self._entries[key] = _Entry(value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: Hashable):
+        if self._entries.pop(key, None) is not None:
+            self.stats.evictions += 1
+
+
+leaderboard_cache = LeaderboardCache(
+    ttl=float(os.getenv("LEADERBOARD_CACHE_TTL", "5")),
+    max_entries=int(os.getenv("LEADERBOARD_CACHE_MAX_ENTRIES", "64")),
+)
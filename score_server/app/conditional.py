@@ -0,0 +1,128 @@
+import os
+import time
+import zlib
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import Response
+
+# Clients and CDNs may reuse a read response this long, then serve it stale for
+# up to the second value while they revalidate it in the background
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "5"))
+HTTP_CACHE_STALE_WHILE_REVALIDATE = int(os.getenv("HTTP_CACHE_STALE_WHILE_REVALIDATE", "30"))
+CACHE_CONTROL = f"public, max-age={HTTP_CACHE_MAX_AGE}, stale-while-revalidate={HTTP_CACHE_STALE_WHILE_REVALIDATE}"
+
+# What a change affects: every submission or claim shifts ranks, while the
+# claimed leaderboard only changes with claims
+SCORES = "s"
+CLAIMS = "c"
+
+
+@dataclass(frozen=True)
+class Version:
+    """The data a response was built from, as seen when it was built"""
+    tag: str
+    # Wall time of the last change included, or 0 when none was seen
+    changed_at: float
+    taken_at: float
+
+    def variant(self, key) -> "Version":
+        """The same version, for a response that also depends on ``key``"""
+        return replace(self, tag=f"{self.tag}-{zlib.crc32(repr(key).encode()):08x}")
+
+    @property
+    def etag(self) -> str:
+        return f'W/"{self.tag}"'
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        # A later change within the same second would be invisible to
+        # If-Modified-Since, so the header waits until that second is over
+        if not self.changed_at or int(self.taken_at) <= int(self.changed_at):
+            return None
+        return formatdate(int(self.changed_at), usegmt=True)
+
+
+class ChangeTracker:
+    """Versions live data so read responses can be validated without the database
+
+    Tags are built from ``position()``: the latest score ID and the number
+    of scores and claims. Every worker loads those from the database and
+    moves them with the same score events, so a tag handed out by one
+    worker validates on the others. ``note_change`` records when the data
+    last changed, for Last-Modified.
+    """
+
+    def __init__(
+        self,
+        position: Callable[[], Tuple[int, int, int]] = lambda: (0, 0, 0),
+        settle_seconds: float = 0,
+    ):
+        self.position = position
+        # With a read replica, reads may briefly miss a change that was
+        # already counted; tagging responses as unsettled until the replica
+        # has caught up keeps one built from lagging data from validating forever
+        self.settle_seconds = settle_seconds
+        self._changed_at = {SCORES: 0.0, CLAIMS: 0.0}
+
+    def note_change(self, claim: bool = False):
+        now = time.time()
+        for kind in (SCORES, CLAIMS) if claim else (SCORES,):
+            self._changed_at[kind] = now
+
+    def current(self, kind: str) -> Version:
+        latest_score_id, scores, claims = self.position()
+        tag = f"{CLAIMS}{claims}" if kind == CLAIMS else f"{SCORES}{latest_score_id}.{scores}.{claims}"
+        now = time.time()
+        if now - self._changed_at[kind] < self.settle_seconds:
+            tag += "-unsettled"
+        return Version(tag, self._changed_at[kind], now)
+
+
+def snapshot_version(snapshot_at: Optional[datetime]) -> Version:
+    """Version of a response read from the leaderboard snapshot
+
+    Such a response only changes when the snapshot is refreshed, so its
+    refresh time is the tag, and it is the same on every worker.
+    """
+    if snapshot_at is None:
+        return Version("snapshot-empty", 0, time.time())
+    changed_at = snapshot_at.replace(tzinfo=timezone.utc).timestamp()
+    return Version(f"snapshot-{int(changed_at * 1_000_000)}", changed_at, time.time())
+
+
+def validators(version: Version) -> dict:
+    """ETag, Last-Modified and Cache-Control headers for a response built at ``version``"""
+    headers = {"ETag": version.etag, "Cache-Control": CACHE_CONTROL}
+    last_modified = version.last_modified
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+    return headers
+
+
+def is_fresh(headers: Headers, version: Version) -> bool:
+    """Whether the client's copy, per If-None-Match or If-Modified-Since, is still current"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: gzip and identity bodies share a tag
+        tags = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+        return "*" in tags or f'"{version.tag}"' in tags
+
+    if_modified_since = headers.get("if-modified-since")
+    if not if_modified_since or version.last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(version.changed_at) <= since
+
+
+def not_modified(version: Version) -> Response:
+    return Response(status_code=304, headers=validators(version))
+
+
+change_tracker = ChangeTracker()
@@ -1,17 +1,220 @@
+import asyncio
 import asyncpg
+import contextvars
+import functools
+import inspect
 import os
-from datetime import datetime
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from typing import Optional
 import logging
 from dotenv import load_dotenv
 
+from .metrics import POOL_ACQUIRE_LATENCY, POOL_WAITERS, record_query, timed
+from .migrations import migrate
+from .rank_index import RankIndex
+
 # Load environment variables from .env file
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Share of the field (by rank) that counts as a high score
+HIGH_SCORE_FRACTION = 0.1
+# Savings thresholds reported by the score distribution
+DISTRIBUTION_PERCENTILES = (25, 50, 75, 90, 95, 99)
+
+# Longest a partition attach or detach waits for its locks on the scores table
+PARTITION_LOCK_TIMEOUT = "5s"
+
+# Arbitrary key for pg_try_advisory_xact_lock so one worker refreshes the snapshot at a time
+SNAPSHOT_LOCK_ID = 7_404_552
+
+# NOTIFY channel fed by the scores_notify trigger
+SCORE_EVENTS_CHANNEL = "score_events"
+# Session setting naming the process a pool connection belongs to; the
+# notify trigger appends it to each event
+ORIGIN_SETTING = "inkless.origin"
+# NOTIFY channels naming a changed event (events_notify trigger) and carrying
+# the time of each leaderboard snapshot refresh
+EVENT_CHANGES_CHANNEL = "event_changes"
+SNAPSHOT_REFRESHES_CHANNEL = "snapshot_refreshes"
+# NOTIFY channel carrying the origin of a worker that detached score partitions
+PARTITION_ARCHIVES_CHANNEL = "partition_archives"
+EVENT_INSERT = "insert"
+EVENT_CLAIM = "claim"
+LISTENER_RETRY_SECONDS = 5
+
+# Matches no score; warm-up uses it where an empty session ID takes another code path
+WARM_UP_SESSION_ID = "00000000-0000-0000-0000-000000000000"
+
+# Connection that Database.acquire() hands out instead of using the pool (warm-up only)
+_pinned_connection = contextvars.ContextVar("pinned_connection", default=None)
+# Set while a replica_read method runs against the read replica
+_use_replica = contextvars.ContextVar("use_replica", default=False)
+
+# The replica can't be reached; reads go to the primary for a while
+REPLICA_DOWN_ERRORS = (OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError, asyncpg.InterfaceError)
+REPLICA_RETRY_SECONDS = 10
+
+# Outcomes of Database.claim_score
+CLAIM_OK = "claimed"
+CLAIM_NOT_FOUND = "not_found"
+CLAIM_ALREADY_CLAIMED = "already_claimed"
+CLAIM_NICKNAME_TAKEN = "nickname_taken"
+
+
+class DatabaseBusyError(Exception):
+    """No pool connection became free within the acquire budget"""
+
+
+# Errors after which a replica read is retried on the primary
+REPLICA_FALLBACK_ERRORS = (*REPLICA_DOWN_ERRORS, DatabaseBusyError, asyncpg.SerializationError)
+_NO_ROW = object()
+
+
+def replica_read(session_arg: str = None, after_claims: bool = False, retry_missing: bool = False):
+    """Run a read-only Database method against the read replica when there is one
+
+    Falls back to the primary when the replica fails (or its pool is busy)
+    before any row was returned. For read-your-writes, the primary is used
+    instead while ``session_arg`` names a session this worker wrote within
+    ``read_your_writes_window`` seconds, or with ``after_claims`` while any
+    claim was seen that recently. ``retry_missing`` re-reads a ``None``
+    result from the primary, in case the row hasn't replicated yet.
+    """
+    def decorate(method):
+        signature = inspect.signature(method)
+
+        def use_replica(db, args, kwargs):
+            if not db.replica_available():
+                return False
+            if after_claims and db.claimed_recently():
+                return False
+            if session_arg is not None:
+                session_id = signature.bind(db, *args, **kwargs).arguments.get(session_arg)
+                if session_id is not None and db.written_recently(session_id):
+                    return False
+            return True
+
+        if inspect.isasyncgenfunction(method):
+            @functools.wraps(method)
+            async def wrapper(self, *args, **kwargs):
+                rows = method(self, *args, **kwargs)
+                try:
+                    if use_replica(self, args, kwargs):
+                        # Only the first step picks the pool; the context variable
+                        # must not leak into the consumer between rows
+                        first = _NO_ROW
+                        token = _use_replica.set(True)
+                        try:
+                            first = await rows.__anext__()
+                        except StopAsyncIteration:
+                            return
+                        except REPLICA_FALLBACK_ERRORS as e:
+                            self._replica_failed(e)
+                            await rows.aclose()
+                            rows = method(self, *args, **kwargs)
+                        finally:
+                            _use_replica.reset(token)
+                        if first is not _NO_ROW:
+                            yield first
+                    async for item in rows:
+                        yield item
+                finally:
+                    await rows.aclose()
+            return wrapper
+
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            if use_replica(self, args, kwargs):
+                token = _use_replica.set(True)
+                try:
+                    result = await method(self, *args, **kwargs)
+                    if result is not None or not retry_missing:
+                        return result
+                except REPLICA_FALLBACK_ERRORS as e:
+                    self._replica_failed(e)
+                finally:
+                    _use_replica.reset(token)
+            return await method(self, *args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def window_conditions(window: Optional[tuple], first_param: int):
+    """SQL conditions and arguments restricting ``timestamp`` to a ``(since, until)`` window
+
+    The bounds are compared directly against the partition key so the planner
+    prunes every partition outside the window. Either bound may be None.
+    """
+    conditions, args = [], []
+    since, until = window or (None, None)
+    if since is not None:
+        args.append(since)
+        conditions.append(f"timestamp >= ${first_param + len(args) - 1}")
+    if until is not None:
+        args.append(until)
+        conditions.append(f"timestamp < ${first_param + len(args) - 1}")
+    return "".join(f" AND {condition}" for condition in conditions), args
+
+
 class Database:
     def __init__(self):
         self.pool = None
+        # Optional read replica for read-only methods (see replica_read)
+        self.read_pool = None
+        self.read_database_url = os.getenv("DATABASE_READ_URL")
+        self.read_your_writes_window = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+        self._replica_down_until = 0.0
+        self._recent_writes = OrderedDict()  # session_id -> monotonic deadline
+        self._last_claim_seen = float("-inf")
+        self.rank_index = RankIndex()
+        # Highest score ID and number of claims, loaded and moved along with
+        # the rank index; every worker sees the same values once events land
+        self.latest_score_id = 0
+        self.claim_count = 0
+        # (id, total_savings) of scores and score IDs of claims counted while
+        # the index reloads, or None
+        self._rank_reload = None
+        self._claim_reload = None
+        self._rank_reload_lock = asyncio.Lock()
+        # Serve leaderboard reads from the precomputed leaderboard_snapshot view
+        self.snapshot_enabled = os.getenv("LEADERBOARD_SNAPSHOT", "").lower() in ("1", "true", "yes")
+        # Latest snapshot refresh any worker has announced, or None if unknown
+        self.snapshot_at = None
+        # Known event windows by event ID, dropped when an event changes; the
+        # generation keeps a load that raced with a change from storing
+        self._event_windows = {}
+        self._event_generation = 0
+        # Cross-worker change feed: a dedicated LISTEN connection. Our pool
+        # connections tag the events they cause with this origin, so we can
+        # skip our own (backend PIDs are reused once connections are recycled)
+        self._listener = None
+        self._listener_task = None
+        self._resync_tasks = set()
+        self.origin = uuid.uuid4().hex
+        self._event_handlers = []
+        self._resync_handlers = []
+        self._snapshot_handlers = []
+        self._query_loggers = [record_query]
+        # Pool sizing and timeouts; the pool grows towards max_size under load
+        # and closes connections idle for max_inactive_lifetime seconds
+        self.pool_min_size = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+        self.pool_max_size = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+        self.max_inactive_lifetime = float(os.getenv("DB_MAX_INACTIVE_CONNECTION_LIFETIME", "300"))
+        self.statement_cache_size = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+        # Default for every statement; long-running maintenance queries get their own
+        self.command_timeout = float(os.getenv("DB_COMMAND_TIMEOUT", "10"))
+        self.maintenance_timeout = float(os.getenv("DB_MAINTENANCE_TIMEOUT", "300"))
+        # Longest a request waits for a connection before getting a 503
+        self.acquire_timeout = float(os.getenv("DB_ACQUIRE_TIMEOUT", "2"))
+        self.busy_retry_after = int(os.getenv("DB_BUSY_RETRY_AFTER", "1"))
+        # Daily scores partitions are created this many days ahead
+        self.partition_days_ahead = int(os.getenv("SCORE_PARTITION_DAYS_AHEAD", "7"))
         self.database_url = os.getenv("DATABASE_URL")
         if not self.database_url:
             raise ValueError("DATABASE_URL environment variable is required. Please check your .env file.")
@@ -19,241 +222,886 @@ class Database:
     async def connect(self):
         """Create database connection pool"""
         try:
-            self.pool = await asyncpg.create_pool(
-                self.database_url,
-                min_size=1,
-                max_size=10,
-                command_timeout=60
+            self.pool = await self._create_pool(self.database_url, self.pool_min_size)
+            logger.info(
+                "Database connection pool created (min_size=%s, max_size=%s)",
+                self.pool_min_size, self.pool_max_size
             )
-            logger.info("Database connection pool created")
+            if self.read_database_url:
+                await self._connect_replica()
             await self.create_tables()
+            await self.ensure_partitions()
+            await self.warm_up()
+            # Listen before loading so no change falls between the two
+            await self.start_listener()
+            await self.load_rank_index()
+            await self.load_snapshot_at()
         except Exception as e:
-            logger.error(f"Failed to connect to database: {e}")
+            logger.error("Failed to connect to database: %s", e)
             raise
 
     async def disconnect(self):
         """Close database connection pool"""
+        await self.stop_listener()
+        if self.read_pool:
+            await self.read_pool.close()
         if self.pool:
             await self.pool.close()
             logger.info("Database connection pool closed")
 
+    async def _create_pool(self, url: str, min_size: int):
+        return await asyncpg.create_pool(
+            url,
+            min_size=min_size,
+            max_size=self.pool_max_size,
+            max_inactive_connection_lifetime=self.max_inactive_lifetime,
+            statement_cache_size=self.statement_cache_size,
+            command_timeout=self.command_timeout,
+            # Custom plans re-plan every scores partition on each call; the cached
+            # generic plan prunes partitions at execution time instead
+            server_settings={"plan_cache_mode": "force_generic_plan", ORIGIN_SETTING: self.origin},
+            init=self._init_connection
+        )
+
+    async def _connect_replica(self):
+        try:
+            self.read_pool = await self._create_pool(self.read_database_url, self.pool_min_size)
+            logger.info("Read replica pool created")
+        except (*REPLICA_DOWN_ERRORS, asyncpg.PostgresError) as e:
+            # An empty pool connects lazily, so reads find the replica once it is back
+            self.read_pool = await self._create_pool(self.read_database_url, 0)
+            self._replica_failed(e)
+
+    def replica_available(self) -> bool:
+        return self.read_pool is not None and time.monotonic() >= self._replica_down_until
+
+    def _replica_failed(self, error: Exception):
+        if isinstance(error, (DatabaseBusyError, asyncpg.SerializationError)):
+            # Busy or a recovery conflict: this read goes to the primary, the next may not
+            return
+        logger.warning("Read replica unavailable, using the primary for %ss: %s", REPLICA_RETRY_SECONDS, error)
+        self._replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+
+    def note_write(self, session_id: str):
+        """Keep reads about this session on the primary while the replica catches up"""
+        if self.read_pool is None:
+            return
+        now = time.monotonic()
+        self._recent_writes.pop(session_id, None)
+        self._recent_writes[session_id] = now + self.read_your_writes_window
+        # Deadlines are in insertion order, so expired ones are at the front
+        while self._recent_writes:
+            oldest, deadline = next(iter(self._recent_writes.items()))
+            if deadline > now:
+                break
+            del self._recent_writes[oldest]
+
+    def written_recently(self, session_id: str) -> bool:
+        deadline = self._recent_writes.get(session_id)
+        return deadline is not None and deadline > time.monotonic()
+
+    def claimed_recently(self) -> bool:
+        return time.monotonic() - self._last_claim_seen < self.read_your_writes_window
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Check out a pool connection, recording how long callers wait
+
+        Raises DatabaseBusyError if none frees up within ``acquire_timeout``,
+        so requests fail fast instead of queueing behind a saturated pool.
+        """
+        pinned = _pinned_connection.get()
+        if pinned is not None:
+            yield pinned
+            return
+        
+        pool = self.read_pool if _use_replica.get() else self.pool
+        started = time.perf_counter()
+        POOL_WAITERS.inc()
+        try:
+            conn = await pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise DatabaseBusyError(f"No database connection within {self.acquire_timeout}s")
+        finally:
+            POOL_WAITERS.dec()
+            POOL_ACQUIRE_LATENCY.observe(time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            await pool.release(conn)
+
+    async def warm_up(self):
+        """Run the hot statements on each of the pool's min_size connections
+
+        asyncpg prepares and caches statements per connection, so the first
+        requests of a burst would otherwise each pay for a prepare. The
+        statements are the real ones, called with arguments that match no
+        rows; the claim is a no-op for an empty session ID.
+        """
+        await self._warm_pool(self.pool, writes=True)
+        if self.replica_available():
+            await self._warm_pool(self.read_pool, writes=False)
+
+    async def _warm_pool(self, pool, writes: bool):
+        conns = []
+        try:
+            for _ in range(self.pool_min_size):
+                conns.append(await pool.acquire())
+            # Every connection must be idle again before it is released
+            results = await asyncio.gather(
+                *(self._warm_connection(conn, writes) for conn in conns), return_exceptions=True
+            )
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                raise errors[0]
+            logger.info("Warmed up %s database connections", len(conns))
+        except Exception as e:
+            # Only an optimization; e.g. an unpopulated snapshot can't be read yet
+            logger.warning("Could not warm up database connections: %s", e)
+        finally:
+            for conn in conns:
+                await pool.release(conn)
+
+    async def _warm_connection(self, conn, writes: bool):
+        token = _pinned_connection.set(conn)
+        try:
+            await self.get_score("")
+            await self.check_high_score("")
+            await self.check_nickname_taken("")
+            # A non-empty session, or the statement excluding it isn't the one prepared
+            await self.check_nickname_taken("", WARM_UP_SESSION_ID)
+            if writes:
+                await self.claim_score("", "", "")
+            # Last: it fails while the snapshot is unpopulated
+            await self.get_claimed_leaderboard(1)
+        finally:
+            _pinned_connection.reset(token)
+
+    async def _init_connection(self, conn):
+        for callback in self._query_loggers:
+            conn.add_query_logger(callback)
+
+    def add_query_logger(self, callback):
+        """Attach an asyncpg query logger to every pool connection
+
+        Must be called before connect(). The callback runs in the context of
+        the task that issued the query, so context variables identify it.
+        """
+        self._query_loggers.append(callback)
+
+    def on_score_event(self, handler):
+        """Register handler(kind, total_savings) for score changes made by other workers"""
+        self._event_handlers.append(handler)
+
+    def on_snapshot_refresh(self, handler):
+        """Register handler() for when a newer leaderboard snapshot is known
+
+        Runs after this worker refreshes the snapshot or hears another announce it.
+        """
+        self._snapshot_handlers.append(handler)
+
+    def on_resync(self, handler):
+        """Register an async handler run after the change feed reconnects
+
+        Notifications sent while disconnected are lost, so in-process state
+        should be rebuilt from scratch. Also runs when another worker archives
+        score partitions, since their rows leave without an event per score.
+        """
+        self._resync_handlers.append(handler)
+
+    async def start_listener(self):
+        """Open the dedicated LISTEN connection for cross-worker change events"""
+        conn = await asyncpg.connect(self.database_url)
+        conn.add_termination_listener(self._on_listener_lost)
+        await conn.add_listener(SCORE_EVENTS_CHANNEL, self._on_notification)
+        await conn.add_listener(EVENT_CHANGES_CHANNEL, self._on_event_change)
+        await conn.add_listener(SNAPSHOT_REFRESHES_CHANNEL, self._on_snapshot_refresh)
+        await conn.add_listener(PARTITION_ARCHIVES_CHANNEL, self._on_partitions_archived)
+        self._listener = conn
+        logger.info("Listening for score events on '%s'", SCORE_EVENTS_CHANNEL)
+
+    async def stop_listener(self):
+        if self._listener_task:
+            self._listener_task.cancel()
+            self._listener_task = None
+        for task in self._resync_tasks:
+            task.cancel()
+        if self._listener:
+            listener, self._listener = self._listener, None
+            await listener.close()
+
+    def _on_notification(self, conn, pid, channel, payload):
+        try:
+            op, score_id, savings, *origin = payload.split(":")
+            kind = EVENT_INSERT if op == "i" else EVENT_CLAIM
+            score_id, total_savings = int(score_id), int(savings)
+        except ValueError:
+            logger.warning("Ignoring malformed score event: %r", payload)
+            return
+        if origin == [self.origin]:
+            return
+        
+        if kind == EVENT_INSERT:
+            self.count_score(score_id, total_savings)
+        else:
+            self.count_claim(score_id)
+            self._last_claim_seen = time.monotonic()
+        for handler in self._event_handlers:
+            try:
+                handler(kind, total_savings)
+            except Exception as e:
+                logger.error("Score event handler failed: %s", e)
+
+    def _on_event_change(self, conn, pid, channel, payload):
+        self.forget_event(payload)
+
+    def _on_snapshot_refresh(self, conn, pid, channel, payload):
+        try:
+            self.note_snapshot(datetime.fromisoformat(payload))
+        except ValueError:
+            logger.warning("Ignoring malformed snapshot refresh: %r", payload)
+
+    def _on_partitions_archived(self, conn, pid, channel, payload):
+        if payload == self.origin:
+            return  # archive_partitions already reloaded this worker
+        task = asyncio.create_task(self.resync())
+        self._resync_tasks.add(task)
+        task.add_done_callback(self._resync_tasks.discard)
+
+    def _on_listener_lost(self, conn):
+        if self._listener is not conn:
+            return  # closed on purpose
+        self._listener = None
+        logger.warning("Score event listener connection lost, reconnecting")
+        self._listener_task = asyncio.create_task(self._reconnect_listener())
+
+    async def _reconnect_listener(self):
+        while True:
+            try:
+                await self.start_listener()
+                break
+            except Exception as e:
+                logger.warning("Could not reconnect score event listener: %s", e)
+                await asyncio.sleep(LISTENER_RETRY_SECONDS)
+        self._listener_task = None
+        # Resync everything we may have missed while disconnected
+        await self.resync()
+
+    async def resync(self):
+        """Rebuild in-process state from the database and run the resync handlers"""
+        self.forget_event()
+        try:
+            await self.load_rank_index()
+            await self.load_snapshot_at()
+        except Exception as e:
+            logger.warning("Could not reload rank index for resync: %s", e)
+        for handler in self._resync_handlers:
+            try:
+                await handler()
+            except Exception as e:
+                logger.error("Resync handler failed: %s", e)
+
     async def create_tables(self):
         """Create database tables if they don't exist and handle migrations"""
-        async with self.pool.acquire() as conn:
-            # Create the base table
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS scores (
-                    id SERIAL PRIMARY KEY,
-                    session_id VARCHAR(50) UNIQUE NOT NULL,
-                    final_bill INTEGER NOT NULL,
-                    total_savings INTEGER NOT NULL,
-                    timestamp TIMESTAMP NOT NULL,
-                    email VARCHAR(255),
-                    claimed_at TIMESTAMP,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            
-            # Add nickname column if it doesn't exist (migration)
+        version = await migrate(self.pool)
+        logger.info("Database schema verified at version %s", version)
+
+    def count_score(self, score_id: int, total_savings: int):
+        """Add a new score to the rank index, and note it for a reload in progress"""
+        self.rank_index.add(total_savings)
+        self.latest_score_id = max(self.latest_score_id, score_id)
+        if self._rank_reload is not None:
+            self._rank_reload.append((score_id, total_savings))
+
+    def count_claim(self, score_id: int):
+        """Count a new claim, and note it for a reload in progress"""
+        self.claim_count += 1
+        if self._claim_reload is not None:
+            self._claim_reload.append(score_id)
+
+    def change_position(self):
+        """``(latest score ID, scores, claims)``, the same on every worker that saw the same changes"""
+        return self.latest_score_id, self.rank_index.total, self.claim_count
+
+    @timed
+    async def load_rank_index(self):
+        """(Re)build the in-memory rank index from the scores table
+
+        Also reloads the latest score ID and the claim count. Scores and
+        claims counted while the queries run may or may not be in their
+        snapshot. Those it missed are looked up in the same snapshot and
+        added before the new values replace the old ones, so none is lost
+        or counted twice.
+        """
+        async with self._rank_reload_lock:
+            pending = self._rank_reload = []
+            pending_claims = self._claim_reload = []
             try:
-                await conn.execute("""
-                    ALTER TABLE scores ADD COLUMN IF NOT EXISTS nickname VARCHAR(25);
-                """)
+                async with self.acquire() as conn, conn.transaction(isolation="repeatable_read", readonly=True):
+                    rows = await conn.fetch("""
+                        SELECT total_savings, COUNT(*) FROM score_entries GROUP BY total_savings
+                    """, timeout=self.maintenance_timeout)
+                    index = RankIndex()
+                    index.load((row[0], row[1]) for row in rows)
+                    latest_score_id, claims = await conn.fetchrow("""
+                        SELECT (SELECT COALESCE(MAX(id), 0) FROM score_entries), (SELECT COUNT(*) FROM claims)
+                    """, timeout=self.maintenance_timeout)
+                    
+                    checked = checked_claims = 0
+                    while checked < len(pending) or checked_claims < len(pending_claims):
+                        batch, checked = pending[checked:], len(pending)
+                        claimed, checked_claims = pending_claims[checked_claims:], len(pending_claims)
+                        seen = {row[0] for row in await conn.fetch("""
+                            SELECT id FROM score_entries WHERE id = ANY($1::int[])
+                        """, [score_id for score_id, _ in batch])}
+                        for score_id, total_savings in batch:
+                            if score_id not in seen:
+                                index.add(total_savings)
+                                latest_score_id = max(latest_score_id, score_id)
+                        seen = {row[0] for row in await conn.fetch("""
+                            SELECT score_id FROM claims WHERE score_id = ANY($1::int[])
+                        """, claimed)}
+                        claims += sum(1 for score_id in claimed if score_id not in seen)
+                    # No await since the last check, so nothing new is pending
+                    self.rank_index = index
+                    self.latest_score_id = latest_score_id
+                    self.claim_count = claims
+            finally:
+                self._rank_reload = None
+                self._claim_reload = None
+        logger.info("Rank index loaded: %s scores, %s distinct values", index.total, len(rows))
+
+    async def run_rank_index_reconciler(self, interval: float):
+        """Reload the rank index now and then, as a safety net for the change feed
+
+        The feed keeps the index current and a reconnect reloads it, so this
+        only corrects drift; ``interval`` <= 0 disables it.
+        """
+        if interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.load_rank_index()
             except Exception as e:
-                # If ALTER TABLE IF NOT EXISTS doesn't work, try checking if column exists first
+                logger.warning("Could not reconcile rank index: %s", e)
+
+    async def ensure_partitions(self):
+        """Create the daily scores partitions for today and the next few days (UTC)
+
+        Attaching a partition briefly locks the default partition, which full
+        scans read. If a long read holds it, the remaining days are left to the
+        next run; they are created days ahead, so nothing waits on them.
+
+        A day that already has rows in the default partition cannot be
+        attached. Claims reference those rows, so they are not moved; the day
+        is skipped and keeps living in the default partition.
+        """
+        today = datetime.utcnow().date()
+        async with self.acquire() as conn:
+            for offset in range(self.partition_days_ahead + 1):
+                day = today + timedelta(days=offset)
                 try:
-                    column_exists = await conn.fetchval("""
-                        SELECT column_name FROM information_schema.columns 
-                        WHERE table_name='scores' AND column_name='nickname';
-                    """)
-                    if not column_exists:
-                        await conn.execute("ALTER TABLE scores ADD COLUMN nickname VARCHAR(25);")
-                except Exception as e2:
-                    logger.warning(f"Could not add nickname column: {e2}")
-            
-            # Create indexes for better performance
-            await conn.execute("""
-                CREATE INDEX IF NOT EXISTS idx_session_id ON scores(session_id);
-                CREATE INDEX IF NOT EXISTS idx_total_savings_desc ON scores(total_savings DESC);
-                CREATE INDEX IF NOT EXISTS idx_claimed ON scores(email) WHERE email IS NOT NULL;
-                CREATE INDEX IF NOT EXISTS idx_timestamp ON scores(timestamp DESC);
-            """)
-            
-            # Create nickname index only if column exists
+                    async with conn.transaction():
+                        await conn.execute(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'")
+                        await conn.execute("SELECT create_score_partition($1)", day)
+                except asyncpg.LockNotAvailableError:
+                    logger.warning("Score partitions for %s onwards are busy, will retry", day)
+                    return
+                except asyncpg.CheckViolationError:
+                    logger.warning("Scores for %s are already in the default partition, not partitioning that day", day)
+
+    async def run_partition_maintenance(self, interval: float):
+        """Keep daily partitions created ahead of the clock"""
+        while True:
+            await asyncio.sleep(interval)
             try:
-                await conn.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_nickname ON scores(nickname) WHERE nickname IS NOT NULL;
-                    CREATE INDEX IF NOT EXISTS idx_email ON scores(email) WHERE email IS NOT NULL;
-                """)
+                await self.ensure_partitions()
             except Exception as e:
-                logger.warning(f"Could not create nickname indexes: {e}")
-            
-        logger.info("Database tables created/verified")
+                logger.warning("Could not create score partitions: %s", e)
+
+    async def archive_partitions(self, before: date):
+        """Detach the daily partitions that ended by ``before`` and hold no claims
+
+        A detached partition is renamed ``archived_<name>`` and kept as a plain
+        table to dump or drop; detaching only touches the catalog. Partitions
+        with claimed scores stay attached. Returns the detached and kept names.
+        """
+        async with self.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT c.relname AS name
+                FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'score_entries'::regclass AND c.relname ~ '^scores_p[0-9]{8}$'
+                ORDER BY c.relname
+            """)
+            detached, kept = [], []
+            for row in rows:
+                name = row['name']
+                day = datetime.strptime(name[len("scores_p"):], "%Y%m%d").date()
+                if day + timedelta(days=1) > before:
+                    continue
+                if await conn.fetchval("""
+                    SELECT EXISTS (SELECT 1 FROM claims WHERE timestamp >= $1 AND timestamp < $2)
+                """, day, day + timedelta(days=1)):
+                    kept.append(name)
+                    continue
+                async with conn.transaction():
+                    # Detaching locks the parent; give up rather than queue behind long reads
+                    await conn.execute(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'")
+                    await conn.execute(f'ALTER TABLE score_entries DETACH PARTITION "{name}"')
+                    await conn.execute(f'ALTER TABLE "{name}" RENAME TO "archived_{name}"')
+                detached.append(name)
+                logger.info("Archived score partition %s", name)
+            if detached:
+                # Other workers still count the archived rows
+                await conn.execute("SELECT pg_notify($1, $2)", PARTITION_ARCHIVES_CHANNEL, self.origin)
+
+        if detached:
+            await self.load_rank_index()
+        return detached, kept
 
+    async def get_event_window(self, event_id: str):
+        """The ``(starts_at, ends_at)`` window of an event, or None if unknown
+
+        Known windows are served from memory; unknown IDs always query.
+        """
+        window = self._event_windows.get(event_id)
+        if window is not None:
+            return window
+        generation = self._event_generation
+        window = await self.load_event_window(event_id)
+        if window is not None and generation == self._event_generation:
+            self._event_windows[event_id] = window
+        return window
+
+    def forget_event(self, event_id: str = None):
+        """Drop a cached event window, or all of them"""
+        self._event_generation += 1
+        if event_id is None:
+            self._event_windows.clear()
+        else:
+            self._event_windows.pop(event_id, None)
+
+    @timed
+    async def load_event_window(self, event_id: str):
+        # The primary, so a window is never cached from a replica that lags a change
+        async with self.acquire() as conn:
+            row = await conn.fetchrow("""
+                SELECT starts_at, ends_at FROM events WHERE event_id = $1
+            """, event_id)
+        return (row['starts_at'], row['ends_at']) if row else None
+
+    @timed
+    async def save_event(self, event_id: str, name: Optional[str], starts_at: datetime, ends_at: datetime):
+        """Create or update an event's time window"""
+        async with self.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO events (event_id, name, starts_at, ends_at)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (event_id) DO UPDATE
+                SET name = EXCLUDED.name, starts_at = EXCLUDED.starts_at, ends_at = EXCLUDED.ends_at
+            """, event_id, name, starts_at, ends_at)
+        # Other workers hear of it from the events_notify trigger
+        self.forget_event(event_id)
+
+    @timed
     async def submit_score(self, session_id: str, final_bill: int, total_savings: int, timestamp: str):
         """Submit a new score to the database"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             # For simplicity, just use current UTC time
             # The client timestamp is informational but we'll use server time for consistency
             dt = datetime.utcnow()
             
-            await conn.execute("""
-                INSERT INTO scores (session_id, final_bill, total_savings, timestamp)
-                VALUES ($1, $2, $3, $4)
+            # The session registry enforces uniqueness across partitions; a
+            # duplicate raises a unique violation before anything is written
+            score_id = await conn.fetchval("""
+                WITH session AS (
+                    INSERT INTO score_sessions (session_id, timestamp) VALUES ($1, $4) RETURNING session_id
+                )
+                INSERT INTO score_entries (session_id, final_bill, total_savings, timestamp)
+                SELECT session_id, $2, $3, $4 FROM session
+                RETURNING id
             """, session_id, final_bill, total_savings, dt)
+        
+        self.note_write(session_id)
+        self.count_score(score_id, total_savings)
 
+    @timed
+    async def submit_scores(self, records: list):
+        """Insert many (session_id, final_bill, total_savings, timestamp) records at once
+
+        Returns the set of session IDs that were inserted; the rest already existed.
+        """
+        session_ids, final_bills, savings, timestamps = zip(*records)
+        async with self.acquire() as conn:
+            rows = await conn.fetch("""
+                WITH batch AS (
+                    SELECT DISTINCT ON (session_id) *
+                    FROM unnest($1::varchar[], $2::int[], $3::int[], $4::timestamp[])
+                        AS b(session_id, final_bill, total_savings, timestamp)
+                ), fresh AS (
+                    INSERT INTO score_sessions (session_id, timestamp) SELECT session_id, timestamp FROM batch
+                    ON CONFLICT DO NOTHING
+                    RETURNING session_id
+                )
+                INSERT INTO score_entries (session_id, final_bill, total_savings, timestamp)
+                SELECT batch.* FROM batch JOIN fresh USING (session_id)
+                RETURNING id, session_id, total_savings
+            """, session_ids, final_bills, savings, timestamps)
+        
+        for row in rows:
+            self.note_write(row['session_id'])
+            self.count_score(row['id'], row['total_savings'])
+        return {row['session_id'] for row in rows}
+
+    @timed
+    @replica_read(session_arg="session_id", retry_missing=True)
     async def get_score(self, session_id: str):
         """Get a score by session ID"""
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
+            # The registry's timestamp lets the executor prune to the one partition
             return await conn.fetchrow("""
-                SELECT * FROM scores WHERE session_id = $1
+                SELECT * FROM scores
+                WHERE session_id = $1
+                AND timestamp = (SELECT timestamp FROM score_sessions WHERE session_id = $1)
             """, session_id)
 
+    @timed
     async def claim_score(self, session_id: str, email: str, nickname: str):
-        """Claim a score with both email and nickname"""
-        async with self.pool.acquire() as conn:
-            result = await conn.execute("""
-                UPDATE scores 
-                SET email = $1, nickname = $2, claimed_at = CURRENT_TIMESTAMP
-                WHERE session_id = $3 AND email IS NULL
-            """, email, nickname, session_id)
+        """Claim a score with both email and nickname in a single statement
+
+        Returns a dict whose ``status`` is one of ``CLAIM_OK``,
+        ``CLAIM_NOT_FOUND``, ``CLAIM_ALREADY_CLAIMED`` or
+        ``CLAIM_NICKNAME_TAKEN``; successful claims also carry the rank info.
+        Repeating a claim with the same email and nickname also returns
+        ``CLAIM_OK``.
+        """
+        async with self.acquire() as conn:
+            try:
+                row = await conn.fetchrow("""
+                    WITH target AS (
+                        SELECT id, session_id, final_bill, total_savings, timestamp FROM score_entries
+                        WHERE session_id = $1
+                        AND timestamp = (SELECT timestamp FROM score_sessions WHERE session_id = $1)
+                    ), taken AS (
+                        SELECT EXISTS (
+                            SELECT 1 FROM claims
+                            WHERE lower(nickname) = lower($3)
+                            AND session_id != $1
+                        ) AS taken
+                    ), claimed AS (
+                        INSERT INTO claims (score_id, session_id, email, nickname, claimed_at,
+                                            final_bill, total_savings, timestamp)
+                        SELECT id, session_id, $2, $3, CURRENT_TIMESTAMP, final_bill, total_savings, timestamp
+                        FROM target, taken
+                        WHERE NOT taken.taken
+                        ON CONFLICT (score_id) DO NOTHING
+                        RETURNING score_id
+                    )
+                    SELECT
+                        CASE
+                            WHEN NOT EXISTS (SELECT 1 FROM target) THEN 'not_found'
+                            WHEN EXISTS (SELECT 1 FROM claimed) THEN 'claimed'
+                            WHEN EXISTS (SELECT 1 FROM claims WHERE score_id = (SELECT id FROM target))
+                                THEN 'already_claimed'
+                            WHEN (SELECT taken FROM taken) THEN 'nickname_taken'
+                            -- Lost a race with a concurrent claim of the same score
+                            ELSE 'already_claimed'
+                        END AS status,
+                        (SELECT total_savings FROM target) AS total_savings,
+                        (SELECT score_id FROM claimed) AS score_id
+                """, session_id, email, nickname)
+            except asyncpg.UniqueViolationError:
+                # Another claim took the same nickname between our check and insert
+                row = {'status': CLAIM_NICKNAME_TAKEN, 'total_savings': None, 'score_id': None}
+            if row['score_id'] is not None:
+                self.count_claim(row['score_id'])
             
-            # Check if update was successful (row was found and updated)
-            return result == "UPDATE 1"
+            if row['status'] in (CLAIM_ALREADY_CLAIMED, CLAIM_NICKNAME_TAKEN):
+                # The same claim made twice, e.g. a retry racing the original,
+                # succeeds instead of conflicting with itself
+                existing = await conn.fetchrow("""
+                    SELECT email, nickname, total_savings FROM claims
+                    WHERE score_id = (
+                        SELECT id FROM score_entries
+                        WHERE session_id = $1
+                        AND timestamp = (SELECT timestamp FROM score_sessions WHERE session_id = $1)
+                    )
+                """, session_id)
+                if existing is not None and (existing['email'], existing['nickname']) == (email, nickname):
+                    row = {'status': CLAIM_OK, 'total_savings': existing['total_savings']}
+        
+        self.note_write(session_id)
+        result = {'status': row['status'], 'total_savings': row['total_savings']}
+        if row['status'] == CLAIM_OK:
+            self._last_claim_seen = time.monotonic()
+            if self.rank_index.loaded:
+                result.update(self.rank_info(row['total_savings']))
+            else:
+                result.update(await self.check_high_score(session_id))
+        return result
 
+    @timed
+    @replica_read(session_arg="exclude_session")
     async def check_nickname_taken(self, nickname: str, exclude_session: str = None):
-        """Check if a nickname is already taken by another player"""
-        async with self.pool.acquire() as conn:
+        """Check if a nickname is already taken by another player
+
+        An index lookup in claims, so it never touches the scores partitions.
+        """
+        async with self.acquire() as conn:
             if exclude_session:
-                result = await conn.fetchval("""
-                    SELECT COUNT(*) FROM scores 
-                    WHERE LOWER(nickname) = LOWER($1) 
-                    AND session_id != $2
-                    AND nickname IS NOT NULL
+                return await conn.fetchval("""
+                    SELECT EXISTS (
+                        SELECT 1 FROM claims
+                        WHERE lower(nickname) = lower($1)
+                        AND session_id != $2
+                    )
                 """, nickname, exclude_session)
-            else:
-                result = await conn.fetchval("""
-                    SELECT COUNT(*) FROM scores 
-                    WHERE LOWER(nickname) = LOWER($1)
-                    AND nickname IS NOT NULL
-                """, nickname)
             
-            return result > 0
+            return await conn.fetchval("""
+                SELECT EXISTS (
+                    SELECT 1 FROM claims WHERE lower(nickname) = lower($1)
+                )
+            """, nickname)
 
-    async def check_high_score(self, session_id: str):
-        """Check if a score is a high score and get ranking info"""
-        async with self.pool.acquire() as conn:
+    @timed
+    @replica_read(session_arg="session_id", retry_missing=True)
+    async def check_high_score(self, session_id: str, window: tuple = None):
+        """Check if a score is a high score and get ranking info
+
+        With a ``(since, until)`` window the score is ranked only against the
+        scores played in that window, which reads just those partitions.
+        """
+        async with self.acquire() as conn:
             # Get the score details
             score_row = await conn.fetchrow("""
-                SELECT final_bill, total_savings FROM scores WHERE session_id = $1
+                SELECT final_bill, total_savings FROM scores
+                WHERE session_id = $1
+                AND timestamp = (SELECT timestamp FROM score_sessions WHERE session_id = $1)
             """, session_id)
             
             if not score_row:
                 return None
             
-            # Calculate rank based on highest total savings (better score = more savings)
-            rank_row = await conn.fetchrow("""
-                SELECT COUNT(*) + 1 as rank
-                FROM scores 
-                WHERE total_savings > $1
-            """, score_row['total_savings'])
+            if self.rank_index.loaded and window is None:
+                return self.rank_info(score_row['total_savings'])
             
-            # Get total number of scores
-            total_row = await conn.fetchrow("SELECT COUNT(*) as total FROM scores")
+            # Calculate rank based on highest total savings (better score = more savings)
+            window_sql, window_args = window_conditions(window, 2)
+            rank_row = await conn.fetchrow(f"""
+                SELECT
+                    COUNT(*) FILTER (WHERE total_savings > $1) + 1 AS rank,
+                    COUNT(*) FILTER (WHERE total_savings <= $1) AS at_or_below,
+                    COUNT(*) AS total
+                FROM scores
+                WHERE TRUE{window_sql}
+            """, score_row['total_savings'], *window_args)
             
             rank = rank_row['rank']
-            total = total_row['total']
+            total = rank_row['total']
             
             # Consider top 10% as "high scores"
-            is_high_score = rank <= max(1, total * 0.1)
+            is_high_score = rank <= max(1, total * HIGH_SCORE_FRACTION)
             
             return {
                 'is_high_score': is_high_score,
                 'rank': rank,
+                'percentile': round(100 * rank_row['at_or_below'] / total, 1) if total else None,
                 'total_scores': total
             }
 
-    async def get_leaderboard(self, limit: int = None):
-        """Get all scores for leaderboard (claimed and unclaimed)"""
-        async with self.pool.acquire() as conn:
-            # Check if nickname column exists first
-            try:
-                nickname_exists = await conn.fetchval("""
-                    SELECT column_name FROM information_schema.columns 
-                    WHERE table_name='scores' AND column_name='nickname';
-                """)
-                
-                if nickname_exists:
-                    # Include nickname in query if column exists
-                    query = """
-                        SELECT 
-                            session_id,
-                            final_bill,
-                            total_savings,
-                            email,
-                            nickname,
-                            timestamp,
-                            claimed_at,
-                            ROW_NUMBER() OVER (ORDER BY total_savings DESC) as rank
+    def rank_info(self, total_savings: int):
+        """Rank a savings value against the in-memory index"""
+        rank = self.rank_index.rank(total_savings)
+        return {
+            'is_high_score': rank <= self.rank_index.high_score_cutoff(HIGH_SCORE_FRACTION),
+            'rank': rank,
+            'percentile': round(self.rank_index.percentile(total_savings), 1),
+            'total_scores': self.rank_index.total
+        }
+
+    def score_distribution(self, buckets: int):
+        """Histogram and percentile thresholds of all scores, from the in-memory index"""
+        index = self.rank_index
+        return {
+            'total_scores': index.total,
+            'buckets': [
+                {'min_savings': low, 'max_savings': high, 'count': count}
+                for low, high, count in index.histogram(buckets)
+            ],
+            'percentiles': {
+                f"p{p}": index.value_at_percentile(p) for p in DISTRIBUTION_PERCENTILES
+            },
+            'high_score_threshold': index.high_score_threshold(HIGH_SCORE_FRACTION),
+        }
+
+    @timed
+    @replica_read(after_claims=True)
+    async def get_claimed_leaderboard(self, limit: int, after: tuple = None, window: tuple = None):
+        """Get a page of claimed scores ordered by total savings
+
+        ``after`` is the ``(total_savings, id, rank)`` keyset cursor of the last
+        row of the previous page; rows strictly after it are returned. In
+        snapshot mode the rows come from the precomputed snapshot and carry
+        their ``rank`` and ``snapshot_at``. A ``(since, until)`` window limits
+        the page to scores played in it and is always read live.
+        """
+        window_sql, window_args = window_conditions(window, 4 if after else 2)
+        async with self.acquire() as conn:
+            if self.snapshot_enabled and window is None:
+                return await conn.fetch("""
+                    SELECT id, final_bill, total_savings, nickname, timestamp,
+                        claimed_rank AS rank,
+                        (SELECT refreshed_at FROM leaderboard_snapshot_meta) AS snapshot_at
+                    FROM leaderboard_snapshot
+                    WHERE claimed_rank > $2
+                    ORDER BY claimed_rank
+                    LIMIT $1
+                """, limit, after[2] if after else 0)
+            
+            if after is None:
+                return await conn.fetch(f"""
+                    SELECT score_id AS id, final_bill, total_savings, nickname, timestamp
+                    FROM claims
+                    WHERE nickname IS NOT NULL{window_sql}
+                    ORDER BY total_savings DESC, score_id DESC
+                    LIMIT $1
+                """, limit, *window_args)
+            
+            return await conn.fetch(f"""
+                SELECT score_id AS id, final_bill, total_savings, nickname, timestamp
+                FROM claims
+                WHERE nickname IS NOT NULL
+                AND (total_savings, score_id) < ($2, $3){window_sql}
+                ORDER BY total_savings DESC, score_id DESC
+                LIMIT $1
+            """, limit, after[0], after[1], *window_args)
+
+    @timed
+    @replica_read()
+    async def iter_all_scores(
+        self, limit: int = None, after: tuple = None, window: tuple = None, prefetch: int = 1000
+    ):
+        """Stream scores ordered by total savings through a server-side cursor
+
+        ``after`` is a ``(total_savings, id, rank)`` keyset cursor; a ``None``
+        limit streams to the end of the table. A ``(since, until)`` window
+        limits the stream to scores played in it and bypasses the snapshot.
+        """
+        window_sql, window_args = window_conditions(window, 4 if after else 2)
+        async with self.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                if self.snapshot_enabled and window is None:
+                    rows = conn.cursor("""
+                        SELECT id, final_bill, total_savings, claimed, rank,
+                            (SELECT refreshed_at FROM leaderboard_snapshot_meta) AS snapshot_at
+                        FROM leaderboard_snapshot
+                        WHERE rank > $2
+                        ORDER BY rank
+                        LIMIT $1
+                    """, limit, after[2] if after else 0, prefetch=prefetch)
+                elif after is None:
+                    rows = conn.cursor(f"""
+                        SELECT id, final_bill, total_savings, email IS NOT NULL AS claimed
                         FROM scores
-                        ORDER BY total_savings DESC
-                    """
+                        WHERE TRUE{window_sql}
+                        ORDER BY total_savings DESC, id DESC
+                        LIMIT $1
+                    """, limit, *window_args, prefetch=prefetch)
                 else:
-                    # Fallback query without nickname column
-                    query = """
-                        SELECT 
-                            session_id,
-                            final_bill,
-                            total_savings,
-                            email,
-                            timestamp,
-                            claimed_at,
-                            ROW_NUMBER() OVER (ORDER BY total_savings DESC) as rank
+                    rows = conn.cursor(f"""
+                        SELECT id, final_bill, total_savings, email IS NOT NULL AS claimed
                         FROM scores
-                        ORDER BY total_savings DESC
-                    """
-                
-                if limit:
-                    query += f" LIMIT {limit}"
-                    
-                rows = await conn.fetch(query)
-                
-                # Convert to list of dictionaries and ensure nickname field exists
-                result = []
-                for row in rows:
-                    row_dict = dict(row)
-                    if 'nickname' not in row_dict:
-                        row_dict['nickname'] = None
-                    result.append(row_dict)
+                        WHERE (total_savings, id) < ($2, $3){window_sql}
+                        ORDER BY total_savings DESC, id DESC
+                        LIMIT $1
+                    """, limit, after[0], after[1], *window_args, prefetch=prefetch)
+                async for row in rows:
+                    yield row
+
+    @timed
+    async def refresh_leaderboard_snapshot(self, max_age: float = None) -> bool:
+        """Refresh the leaderboard snapshot unless another worker is doing it
+
+        With ``max_age`` the refresh is skipped when the snapshot is younger
+        than that many seconds. Returns whether a refresh ran.
+        """
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", SNAPSHOT_LOCK_ID):
+                    return False
                 
-                return result
+                state = await conn.fetchrow("""
+                    SELECT
+                        (SELECT ispopulated FROM pg_matviews WHERE matviewname = 'leaderboard_snapshot') AS populated,
+                        (SELECT EXTRACT(EPOCH FROM (LOCALTIMESTAMP - refreshed_at)) FROM leaderboard_snapshot_meta) AS age
+                """)
+                if max_age is not None and state['populated'] and state['age'] is not None and state['age'] < max_age:
+                    return False
                 
+                # CONCURRENTLY keeps the snapshot readable but needs an existing population
+                if state['populated']:
+                    await conn.execute(
+                        "REFRESH MATERIALIZED VIEW CONCURRENTLY leaderboard_snapshot",
+                        timeout=self.maintenance_timeout
+                    )
+                else:
+                    await conn.execute(
+                        "REFRESH MATERIALIZED VIEW leaderboard_snapshot", timeout=self.maintenance_timeout
+                    )
+                # Delivered to every worker when this commits
+                refreshed_at = await conn.fetchval("""
+                    WITH meta AS (
+                        UPDATE leaderboard_snapshot_meta SET refreshed_at = CURRENT_TIMESTAMP RETURNING refreshed_at
+                    )
+                    SELECT refreshed_at FROM meta, pg_notify($1, refreshed_at::text)
+                """, SNAPSHOT_REFRESHES_CHANNEL)
+        self.note_snapshot(refreshed_at)
+        return True
+
+    async def load_snapshot_at(self):
+        """Read the snapshot refresh time, for when no announcement has been heard"""
+        if not self.snapshot_enabled:
+            return
+        async with self.acquire() as conn:
+            self.note_snapshot(await conn.fetchval("SELECT refreshed_at FROM leaderboard_snapshot_meta"))
+
+    def note_snapshot(self, refreshed_at: Optional[datetime]):
+        if refreshed_at is None or (self.snapshot_at is not None and refreshed_at <= self.snapshot_at):
+            return
+        self.snapshot_at = refreshed_at
+        for handler in self._snapshot_handlers:
+            try:
+                handler()
             except Exception as e:
-                logger.error(f"Error in get_leaderboard: {e}")
-                # Fallback to basic query without nickname
-                query = """
-                    SELECT 
-                        session_id,
-                        final_bill,
-                        total_savings,
-                        email,
-                        timestamp,
-                        claimed_at,
-                        ROW_NUMBER() OVER (ORDER BY total_savings DESC) as rank
-                    FROM scores
-                    ORDER BY total_savings DESC
-                """
-                if limit:
-                    query += f" LIMIT {limit}"
-                    
-                rows = await conn.fetch(query)
-                result = []
-                for row in rows:
-                    row_dict = dict(row)
-                    row_dict['nickname'] = None  # Add missing nickname field
-                    result.append(row_dict)
-                
-                return result
+                logger.error("Snapshot refresh handler failed: %s", e)
+
+    @timed
+    @replica_read()
+    async def iter_claimed_emails(self, limit: int = None, after: tuple = None, prefetch: int = 1000):
+        """Stream claimed scores, newest claim first, through a server-side cursor
+
+        ``after`` is a ``(claimed_at, id)`` keyset cursor.
+        """
+        async with self.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                if after is None:
+                    rows = conn.cursor("""
+                        SELECT score_id AS id, email, nickname, total_savings, final_bill, claimed_at, timestamp
+                        FROM claims
+                        ORDER BY claimed_at DESC, score_id DESC
+                        LIMIT $1
+                    """, limit, prefetch=prefetch)
+                else:
+                    rows = conn.cursor("""
+                        SELECT score_id AS id, email, nickname, total_savings, final_bill, claimed_at, timestamp
+                        FROM claims
+                        WHERE (claimed_at, score_id) < ($2, $3)
+                        ORDER BY claimed_at DESC, score_id DESC
+                        LIMIT $1
+                    """, limit, after[0], after[1], prefetch=prefetch)
+                async for row in rows:
+                    yield row
 
 # Global database instance - will be initialized when the module loads
 database = Database()
\ No newline at end of file
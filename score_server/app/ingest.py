@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from .database import database
+
+logger = logging.getLogger(__name__)
+
+
+class DuplicateSessionError(Exception):
+    """The session already has a score, either stored or waiting in the queue"""
+
+
+class IngestQueueFullError(Exception):
+    """The ingestion queue is at capacity; the client should retry later"""
+
+
+class ScoreIngestor:
+    """Write-behind queue that inserts submitted scores in batches
+
+    Each submission is validated and queued; a single flusher task writes up to
+    ``batch_size`` queued scores in one multi-row statement, or whatever is
+    queued once ``flush_interval`` seconds have passed since the first one.
+    Submitters wait for their batch to commit, so a duplicate ``session_id`` is
+    still reported to the caller instead of being dropped silently.
+    """
+
+    def __init__(self, db, batch_size: int, flush_interval: float, max_queue: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._pending = {}  # session_id -> future resolved when its batch commits
+        self._task = None
+        self._closed = False
+
+    async def start(self):
+        self._closed = False
+        self._task = asyncio.create_task(self._run())
+        logger.info("Score ingestor started (batch_size=%s, flush_interval=%ss)", self.batch_size, self.flush_interval)
+
+    async def stop(self):
+        """Stop accepting scores and flush everything already queued"""
+        self._closed = True
+        if self._task:
+            await self._queue.join()
+            self._task.cancel()
+            self._task = None
+        logger.info("Score ingestor stopped")
+
+    async def submit(self, session_id: str, final_bill: int, total_savings: int):
+        """Queue a score and wait until it has been written"""
+        if self._closed:
+            raise IngestQueueFullError("Score ingestion is shutting down")
+        if session_id in self._pending:
+            raise DuplicateSessionError(session_id)
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            # For consistency with direct inserts, the server time is the score time
+            self._queue.put_nowait((session_id, final_bill, total_savings, datetime.utcnow()))
+        except asyncio.QueueFull:
+            raise IngestQueueFullError("Score ingestion queue is full")
+        self._pending[session_id] = future
+
+        # Shielded so a client hanging up doesn't cancel the shared batch result
+        await asyncio.shield(future)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch):
+        try:
+            inserted = await self.db.submit_scores(batch)
+        except Exception as e:
+            logger.error("Failed to flush %s scores: %s", len(batch), e)
+            for record in batch:
+                self._resolve(record[0], error=e)
+            return
+
+        for record in batch:
+            session_id = record[0]
+            if session_id in inserted:
+                self._resolve(session_id)
+            else:
+                self._resolve(session_id, error=DuplicateSessionError(session_id))
+        logger.debug("Flushed %s/%s queued scores", len(inserted), len(batch))
+
+    def _resolve(self, session_id: str, error: Exception = None):
+        future = self._pending.pop(session_id, None)
+        if future is None or future.done():
+            return
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+            # Avoid "exception was never retrieved" when the client went away
+            future.exception()
+
+
+score_ingestor = ScoreIngestor(
+    database,
+    batch_size=int(os.getenv("SCORE_INGEST_BATCH_SIZE", "500")),
+    flush_interval=float(os.getenv("SCORE_INGEST_FLUSH_INTERVAL", "0.02")),
+    max_queue=int(os.getenv("SCORE_INGEST_MAX_QUEUE", "10000")),
+)
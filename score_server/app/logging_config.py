@@ -0,0 +1,103 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+# Bookkeeping extras that aren't worth a key in the output (uvicorn adds color_message)
+_SKIPPED_FIELDS = {"sampled", "color_message"}
+# Set through ``extra={"sampled": True}`` on high-volume INFO events
+SAMPLED = {"sampled": True}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with ``extra`` fields as top-level keys"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and key not in _SKIPPED_FIELDS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        elif record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only ``rate`` of the records logged with ``extra=SAMPLED``
+
+    Warnings and errors are never sampled. Kept records carry the rate so
+    counts can be scaled back up.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False) or record.levelno > logging.INFO or self.rate >= 1:
+            return True
+        if random.random() >= self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Only resolve the message and traceback on the calling thread; the
+        # listener thread does the formatting and the blocking write
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging() -> QueueListener:
+    """Route all logging through a queue to a background writer thread
+
+    LOG_LEVEL sets the level, LOG_FORMAT is ``json`` (default) or ``text``,
+    and LOG_SAMPLE_RATE is the fraction of sampled INFO events kept.
+    """
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    formatter = JsonFormatter() if os.getenv("LOG_FORMAT", "json") == "json" else logging.Formatter(TEXT_FORMAT)
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(formatter)
+    records = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(SamplingFilter(float(os.getenv("LOG_SAMPLE_RATE", "1.0"))))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    # Uvicorn installs its own synchronous handlers and levels; send its records
+    # through the queue too, filtered by LOG_LEVEL
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+        uvicorn_logger.setLevel(logging.NOTSET)
+
+    listener = QueueListener(records, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,28 +1,105 @@
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+import asyncio
 import logging
 import os
+import orjson
+import zlib
 from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
-from .database import database
-from .models import ScoreSubmission, ClaimData, ScoreResponse, HighScoreCheck, ClaimResponse
+from pydantic import ValidationError
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from .assets import STATIC_DIR, STATIC_PATH, CachedStaticFiles, templates
+from .cache import LeaderboardPage, leaderboard_cache
+from .conditional import CLAIMS, SCORES, change_tracker, is_fresh, not_modified, snapshot_version, validators
+from .database import (
+    CLAIM_ALREADY_CLAIMED, CLAIM_NICKNAME_TAKEN, CLAIM_NOT_FOUND, CLAIM_OK, EVENT_CLAIM,
+    DatabaseBusyError, database
 )
+from .ingest import DuplicateSessionError, IngestQueueFullError, score_ingestor
+from .ratelimit import AdmissionMiddleware
+from .realtime import leaderboard_broadcaster
+from .snapshot import snapshot_refresher
+from .streaming import StreamSafeGZipMiddleware, chunked, csv_line, prime
+from .logging_config import SAMPLED, configure_logging
+from .metrics import MetricsMiddleware, register_collectors, render_metrics
+from .models import (
+    ScoreSubmission, ClaimData, ScoreResponse, HighScoreCheck, ClaimResponse, ScoreDistribution,
+    EventWindow, NicknameAvailability, ScoreBatchResponse, clean_nickname
+)
+
+# Configure logging: JSON lines written from a background thread, LOG_LEVEL honored
+configure_logging()
 logger = logging.getLogger(__name__)
 
+SSE_KEEPALIVE_SECONDS = 15
+
+# "direct" inserts each score on its own; "batch" queues them for the ingestor
+INGEST_MODE = os.getenv("SCORE_INGEST_MODE", "direct")
+
+# Most scores one /api/scores/batch request may carry, and its largest body once decompressed
+SCORE_BATCH_MAX_ITEMS = int(os.getenv("SCORE_BATCH_MAX_ITEMS", "500"))
+SCORE_BATCH_MAX_BYTES = 1024 * 1024
+
+# Per-item outcomes of /api/scores/batch
+BATCH_CREATED = "created"
+BATCH_EXISTS = "exists"
+BATCH_INVALID = "invalid"
+
+def on_remote_score_event(kind: str, total_savings: int):
+    """Keep this worker's caches in step with writes made by other workers"""
+    snapshot_refresher.note_write()
+    change_tracker.note_change(claim=kind == EVENT_CLAIM)
+    if kind == EVENT_CLAIM:
+        leaderboard_cache.invalidate(lambda page: page.admits(total_savings))
+        leaderboard_broadcaster.notify_change()
+
+async def on_score_events_resync():
+    """Drop everything derived from events that may have been missed"""
+    leaderboard_cache.clear()
+    change_tracker.note_change(claim=True)
+    leaderboard_broadcaster.notify_change()
+
+def on_snapshot_refreshed():
+    """A newer snapshot may include claims that cached and pushed pages predate"""
+    if database.snapshot_enabled:
+        leaderboard_cache.clear()
+        leaderboard_broadcaster.notify_change()
+
+database.on_score_event(on_remote_score_event)
+database.on_resync(on_score_events_resync)
+database.on_snapshot_refresh(on_snapshot_refreshed)
+change_tracker.position = database.change_position
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await database.connect()
+    if database.read_pool is not None:
+        change_tracker.settle_seconds = database.read_your_writes_window
+    reconciler = asyncio.create_task(
+        database.run_rank_index_reconciler(float(os.getenv("RANK_INDEX_RECONCILE_SECONDS", "3600")))
+    )
+    partitioner = asyncio.create_task(
+        database.run_partition_maintenance(float(os.getenv("SCORE_PARTITION_CHECK_SECONDS", "3600")))
+    )
+    if INGEST_MODE == "batch":
+        await score_ingestor.start()
+    refresher = asyncio.create_task(snapshot_refresher.run()) if database.snapshot_enabled else None
+    await leaderboard_broadcaster.start(load_pushed_leaderboard)
     logger.info("Application started")
     yield
     # Shutdown
+    await leaderboard_broadcaster.stop()
+    if INGEST_MODE == "batch":
+        await score_ingestor.stop()
+    if refresher:
+        refresher.cancel()
+    reconciler.cancel()
+    partitioner.cancel()
     await database.disconnect()
     logger.info("Application stopped")
 
@@ -30,9 +107,14 @@ app = FastAPI(
     title="Inkless Game Score API",
     description="High score system for the Inkless space invaders game",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+# Innermost, so refused requests are still measured and carry CORS headers,
+# and are turned away before any route code waits for a database connection
+app.add_middleware(AdmissionMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -42,12 +124,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress pages, assets and JSON exports; event streams are passed through
+app.add_middleware(StreamSafeGZipMiddleware, minimum_size=500, compresslevel=6)
+
+# Outermost, so request latency includes the other middleware
+app.add_middleware(MetricsMiddleware)
+register_collectors(database, leaderboard_cache)
+
+app.mount(STATIC_PATH, CachedStaticFiles(directory=STATIC_DIR), name="static")
+
+@app.exception_handler(DatabaseBusyError)
+async def database_busy(request: Request, exc: DatabaseBusyError):
+    """No database connection freed up in time: ask the client to retry shortly"""
+    return JSONResponse(
+        {"detail": "Score server is busy, please retry"},
+        status_code=503,
+        headers={"Retry-After": str(database.busy_retry_after)},
+    )
+
 def format_money(amount: int) -> str:
     """Format money display"""
     if amount >= 1000:
         return f"${amount/1000:.1f}k"
     return f"${amount}"
 
+def encode_cursor(total_savings: int, score_id: int, rank: int) -> str:
+    """Build an opaque keyset cursor from the last row of a page"""
+    return f"{total_savings}:{score_id}:{rank}"
+
+def decode_cursor(cursor: str) -> tuple:
+    """Parse a keyset cursor into (total_savings, id, rank)"""
+    savings, score_id, rank = cursor.split(":")
+    return int(savings), int(score_id), int(rank)
+
+def to_utc(moment: datetime) -> datetime:
+    """Naive UTC, the way score timestamps are stored"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+async def resolve_window(event_id: Optional[str], since: Optional[datetime], until: Optional[datetime]):
+    """Turn ``event_id`` or ``since``/``until`` query parameters into a (since, until) window
+
+    Returns None when neither is given, meaning all scores.
+    """
+    if event_id is not None:
+        if since is not None or until is not None:
+            raise HTTPException(status_code=400, detail="Use either event_id or since/until, not both")
+        window = await database.get_event_window(event_id)
+        if window is None:
+            raise HTTPException(status_code=404, detail="Event not found")
+        return window
+    if since is None and until is None:
+        return None
+    window = (to_utc(since) if since else None, to_utc(until) if until else None)
+    if None not in window and window[0] >= window[1]:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    return window
+
 @app.get("/")
 async def root():
     """API health check"""
@@ -57,50 +191,219 @@ async def root():
 async def submit_score(score: ScoreSubmission):
     """Submit a game score"""
     try:
-        logger.info(f"Attempting to submit score: {score}")
-        
-        await database.submit_score(
-            score.session_id, 
-            score.final_bill, 
-            score.total_savings, 
-            score.timestamp
+        if INGEST_MODE == "batch":
+            await score_ingestor.submit(score.session_id, score.final_bill, score.total_savings)
+        else:
+            await database.submit_score(
+                score.session_id, 
+                score.final_bill, 
+                score.total_savings, 
+                score.timestamp
+            )
+        
+        snapshot_refresher.note_write()
+        change_tracker.note_change()
+        logger.info(
+            "Score submitted for session %s: bill=$%s, savings=$%s",
+            score.session_id, score.final_bill, score.total_savings, extra=SAMPLED
         )
         
-        logger.info(f"Score submitted for session {score.session_id}: bill=${score.final_bill}, savings=${score.total_savings}")
-        
+        # Rank the new score in-process so the client doesn't need a second request
+        standing = database.rank_info(score.total_savings) if database.rank_index.loaded else {}
         return ScoreResponse(
             success=True,
             session_id=score.session_id,
-            message="Score submitted successfully"
+            message="Score submitted successfully",
+            **standing
         )
         
+    except DuplicateSessionError:
+        raise HTTPException(status_code=400, detail=f"Session ID already exists: {score.session_id}")
+    except IngestQueueFullError:
+        raise HTTPException(status_code=503, detail="Score server is busy, please retry", headers={"Retry-After": "1"})
+    except DatabaseBusyError:
+        raise
     except Exception as e:
-        logger.error(f"Error submitting score: {e}")
-        logger.error(f"Error type: {type(e)}")
-        logger.error(f"Error details: {str(e)}")
-        
         if "duplicate key" in str(e).lower():
             raise HTTPException(status_code=400, detail=f"Session ID already exists: {score.session_id}")
         
+        logger.exception("Error submitting score for session %s", score.session_id)
+        
         # For debugging, return more detailed error info
         raise HTTPException(status_code=500, detail=f"Failed to submit score: {str(e)}")
 
+async def read_body(request: Request, max_bytes: int) -> bytes:
+    """The request body, gunzipped when sent with ``Content-Encoding: gzip``
+
+    Bodies larger than ``max_bytes`` once decompressed are refused with 413,
+    without inflating more than that.
+    """
+    encoding = request.headers.get("content-encoding", "identity").lower()
+    if encoding not in ("identity", "gzip"):
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+    
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == "gzip" else None
+    body = bytearray()
+    try:
+        async for chunk in request.stream():
+            if inflater:
+                chunk = inflater.decompress(chunk, max_bytes + 1 - len(body))
+            body += chunk
+            if len(body) > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Request body exceeds {max_bytes} bytes")
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Request body is not valid gzip")
+    if inflater and not inflater.eof:
+        raise HTTPException(status_code=400, detail="Request body is truncated gzip")
+    return bytes(body)
+
+@app.post("/api/scores/batch", response_model=ScoreBatchResponse)
+async def submit_score_batch(request: Request):
+    """Submit many scores at once, e.g. those a kiosk buffered while offline
+
+    The body is a JSON array of score submissions, optionally gzip-encoded.
+    Valid items are inserted in one statement. Resending a session that is
+    already stored is not an error, so a batch can be retried safely. Each
+    item gets its own result, in request order.
+    """
+    try:
+        items = orjson.loads(await read_body(request, SCORE_BATCH_MAX_BYTES))
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Request body is not valid JSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=422, detail="Expected a JSON array of scores")
+    if len(items) > SCORE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {SCORE_BATCH_MAX_ITEMS} scores per batch")
+    
+    results = []
+    scores = {}
+    for item in items:
+        try:
+            score = ScoreSubmission.model_validate(item)
+        except ValidationError as e:
+            session_id = item.get("session_id") if isinstance(item, dict) else None
+            if not isinstance(session_id, str):
+                session_id = None
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error['loc'])
+            results.append({
+                'session_id': session_id,
+                'status': BATCH_INVALID,
+                'error': f"{field}: {error['msg']}" if field else error['msg'],
+            })
+            continue
+        results.append({'session_id': score.session_id})
+        scores.setdefault(score.session_id, score)
+    
+    # Server time is the score time, as for single submissions
+    now = datetime.utcnow()
+    inserted = await database.submit_scores([
+        (score.session_id, score.final_bill, score.total_savings, now) for score in scores.values()
+    ]) if scores else set()
+    
+    for result in results:
+        if 'status' in result:
+            continue
+        session_id = result['session_id']
+        if session_id in inserted:
+            result['status'] = BATCH_CREATED
+            if database.rank_index.loaded:
+                result.update(database.rank_info(scores[session_id].total_savings))
+            # A session repeated within the batch is only created once
+            inserted.discard(session_id)
+            snapshot_refresher.note_write()
+        else:
+            result['status'] = BATCH_EXISTS
+    
+    counts = {status: 0 for status in (BATCH_CREATED, BATCH_EXISTS, BATCH_INVALID)}
+    for result in results:
+        counts[result['status']] += 1
+    if counts[BATCH_CREATED]:
+        change_tracker.note_change()
+    logger.info(
+        "Score batch: %s created, %s existing, %s invalid",
+        counts[BATCH_CREATED], counts[BATCH_EXISTS], counts[BATCH_INVALID], extra=SAMPLED
+    )
+    return ScoreBatchResponse(
+        created=counts[BATCH_CREATED],
+        existing=counts[BATCH_EXISTS],
+        invalid=counts[BATCH_INVALID],
+        results=results,
+    )
+
+def live_version(kind: str, window: tuple = None):
+    """The current version of live data, for a response over ``window``"""
+    version = change_tracker.current(kind)
+    # An event's window can be edited, so the same URL may cover other scores
+    return version.variant(window) if window is not None else version
+
+def current_version(kind: str, window: tuple = None):
+    """Version of a leaderboard or export response as of now, or None if unknown
+
+    Unwindowed responses come from the snapshot in snapshot mode, so they
+    follow the latest refresh announced to this worker.
+    """
+    if database.snapshot_enabled and window is None:
+        return snapshot_version(database.snapshot_at) if database.snapshot_at else None
+    return live_version(kind, window)
+
 @app.get("/api/check-high-score/{session_id}", response_model=HighScoreCheck)
-async def check_high_score(session_id: str):
-    """Check if a score is a high score"""
+async def check_high_score(
+    session_id: str,
+    request: Request,
+    response: Response,
+    event_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """Check if a score is a high score, overall or within an event or time window"""
     try:
-        result = await database.check_high_score(session_id)
+        window = await resolve_window(event_id, since, until)
+        # Ranks only move when scores are submitted or claimed
+        version = live_version(SCORES, window)
+        if is_fresh(request.headers, version):
+            return not_modified(version)
+        
+        result = await database.check_high_score(session_id, window)
         if not result:
             raise HTTPException(status_code=404, detail="Score not found")
         
+        response.headers.update(validators(version))
         return HighScoreCheck(**result)
         
-    except HTTPException:
+    except (HTTPException, DatabaseBusyError):
         raise
     except Exception as e:
-        logger.error(f"Error checking high score: {e}")
+        logger.error("Error checking high score: %s", e)
         raise HTTPException(status_code=500, detail="Failed to check high score")
 
+@app.get("/api/score-distribution", response_model=ScoreDistribution)
+async def score_distribution(buckets: int = Query(20, ge=1, le=200)):
+    """Anonymous histogram and percentile thresholds of every submitted score"""
+    if not database.rank_index.loaded:
+        raise HTTPException(status_code=503, detail="Score distribution is not available yet", headers={"Retry-After": "1"})
+    return database.score_distribution(buckets)
+
+@app.get("/api/nickname-available", response_model=NicknameAvailability)
+async def nickname_available(nickname: str, session_id: Optional[str] = None):
+    """Check whether a nickname is valid and free, for live validation on the claim page"""
+    try:
+        cleaned = clean_nickname(nickname)
+    except ValueError as e:
+        return NicknameAvailability(nickname=nickname, available=False, reason=str(e))
+    
+    try:
+        taken = await database.check_nickname_taken(cleaned, session_id)
+    except DatabaseBusyError:
+        raise
+    except Exception as e:
+        logger.error("Error checking nickname: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to check nickname")
+    
+    if taken:
+        return NicknameAvailability(nickname=cleaned, available=False, reason="Nickname is already taken")
+    return NicknameAvailability(nickname=cleaned, available=True)
+
 @app.get("/claim/{session_id}", response_class=HTMLResponse)
 async def claim_page(session_id: str, request: Request):
     """Display the claim page for a session"""
@@ -108,335 +411,432 @@ async def claim_page(session_id: str, request: Request):
         row = await database.get_score(session_id)
         
         if not row:
-            return HTMLResponse("""
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <title>Score Not Found</title>
-                    <meta name="viewport" content="width=device-width, initial-scale=1">
-                    <style>
-                        body { font-family: Arial, sans-serif; text-align: center; margin: 50px; background: #f8f9fa; }
-                        .container { background: white; padding: 40px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); max-width: 500px; margin: 0 auto; }
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <h1>🚫 Score Not Found</h1>
-                        <p>The score you're looking for doesn't exist or has been removed.</p>
-                        <p><a href="/">← Back to API</a></p>
-                    </div>
-                </body>
-                </html>
-            """, status_code=404)
-        
-        final_bill_formatted = format_money(row['final_bill'])
-        total_savings_formatted = format_money(row['total_savings'])
+            return templates.TemplateResponse("not_found.html", {"request": request}, status_code=404)
+        
+        context = {
+            "request": request,
+            "session_id": session_id,
+            "final_bill": format_money(row['final_bill']),
+            "total_savings": format_money(row['total_savings']),
+            "played_at": row['timestamp'].strftime('%B %d, %Y at %I:%M %p'),
+        }
         
         # If already claimed
         if row['email']:
-            return HTMLResponse(f"""
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <title>Score Already Claimed</title>
-                    <meta name="viewport" content="width=device-width, initial-scale=1">
-                    <style>
-                        body {{ font-family: Arial, sans-serif; max-width: 600px; margin: 50px auto; padding: 20px; background: #f8f9fa; }}
-                        .container {{ background: white; padding: 30px; border-radius: 10px; text-align: center; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                        .score {{ font-size: 24px; margin: 20px 0; background: #e9ecef; padding: 15px; border-radius: 5px; }}
-                        .claimed {{ color: #28a745; font-weight: bold; margin: 20px 0; }}
-                        .meta {{ color: #6c757d; font-size: 14px; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <h1>🎉 Score Already Claimed!</h1>
-                        <div class="score">
-                            <strong>Final Bill:</strong> {final_bill_formatted}<br>
-                            <strong>Total Saved:</strong> {total_savings_formatted}
-                        </div>
-                        <div class="claimed">This score was claimed by:<br><strong>"{row['nickname'] or 'Anonymous'}"</strong></div>
-                        <div class="meta">
-                            <p>Claimed on: {row['claimed_at'].strftime('%B %d, %Y at %I:%M %p')}</p>
-                            <p>Game played on: {row['timestamp'].strftime('%B %d, %Y at %I:%M %p')}</p>
-                        </div>
-                    </div>
-                </body>
-                </html>
-            """)
+            context["nickname"] = row['nickname']
+            context["claimed_at"] = row['claimed_at'].strftime('%B %d, %Y at %I:%M %p')
+            return templates.TemplateResponse("claimed.html", context)
         
-        # Show claim form
-        return HTMLResponse(f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Claim Your Score - Inkless Game</title>
-                <meta name="viewport" content="width=device-width, initial-scale=1">
-                <style>
-                    body {{ font-family: Arial, sans-serif; max-width: 600px; margin: 50px auto; padding: 20px; background: #f8f9fa; }}
-                    .container {{ background: white; padding: 30px; border-radius: 10px; text-align: center; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                    .score {{ font-size: 24px; margin: 20px 0; background: #e9ecef; padding: 15px; border-radius: 5px; }}
-                    .form {{ margin: 30px 0; }}
-                    input[type="email"], input[type="text"] {{ padding: 12px; font-size: 16px; width: 300px; max-width: 100%; border: 2px solid #ddd; border-radius: 5px; }}
-                    button {{ padding: 12px 30px; font-size: 16px; background: #007bff; color: white; border: none; border-radius: 5px; cursor: pointer; margin-top: 10px; transition: background 0.3s; }}
-                    button:hover {{ background: #0056b3; }}
-                    button:disabled {{ background: #6c757d; cursor: not-allowed; }}
-                    .message {{ margin: 20px 0; padding: 15px; border-radius: 5px; }}
-                    .success {{ background: #d4edda; color: #155724; border: 1px solid #c3e6cb; }}
-                    .error {{ background: #f8d7da; color: #721c24; border: 1px solid #f5c6cb; }}
-                    .high-score {{ background: #fff3cd; color: #856404; border: 1px solid #ffeaa7; padding: 15px; margin: 20px 0; border-radius: 5px; animation: pulse 2s infinite; }}
-                    .meta {{ color: #6c757d; font-size: 14px; margin: 10px 0; }}
-                    @keyframes pulse {{ 0% {{ opacity: 1; }} 50% {{ opacity: 0.7; }} 100% {{ opacity: 1; }} }}
-                    .loading {{ display: none; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <h1>🎮 Claim Your Score!</h1>
-                    <div class="score">
-                        <strong>Final Bill:</strong> {final_bill_formatted}<br>
-                        <strong>Total Saved:</strong> {total_savings_formatted}
-                    </div>
-                    
-                    <div class="meta">Game played on: {row['timestamp'].strftime('%B %d, %Y at %I:%M %p')}</div>
-                    
-                    <div id="highScoreCheck"></div>
-                    
-                    <div class="form" id="claimSection">
-                        <p><strong>Claim your score to join the leaderboard!</strong></p>
-                        <form id="claimForm">
-                            <input type="email" id="email" placeholder="your@email.com" required>
-                            <br>
-                            <input type="text" id="nickname" placeholder="Your leaderboard nickname" maxlength="20" required style="margin-top: 10px;">
-                            <br>
-                            <small style="color: #6c757d;">Nickname: 2-20 characters, letters, numbers, and basic symbols only</small>
-                            <br>
-                            <button type="submit" id="submitBtn">
-                                <span class="loading">⏳ Claiming...</span>
-                                <span class="normal">Claim Score</span>
-                            </button>
-                        </form>
-                        <p style="font-size: 12px; color: #6c757d; margin-top: 15px;">
-                            📧 Your email is used for score verification and updates. Only your nickname appears on the public leaderboard.
-                        </p>
-                    </div>
-                    
-                    <div id="message"></div>
-                </div>
-
-                <script>
-                    // Check if this is a high score
-                    fetch('/api/check-high-score/{session_id}')
-                        .then(response => response.json())
-                        .then(data => {{
-                            if (data.is_high_score) {{
-                                document.getElementById('highScoreCheck').innerHTML = 
-                                    `<div class="high-score">🏆 HIGH SCORE! You saved {total_savings_formatted}!<br>
-                                    Rank #${{data.rank}} out of ${{data.total_scores}} players!</div>`;
-                            }}
-                        }})
-                        .catch(err => console.log('Could not check high score status'));
-
-                    document.getElementById('claimForm').addEventListener('submit', async (e) => {{
-                        e.preventDefault();
-                        const email = document.getElementById('email').value;
-                        const nickname = document.getElementById('nickname').value;
-                        const messageDiv = document.getElementById('message');
-                        const submitBtn = document.getElementById('submitBtn');
-                        
-                        // Show loading state
-                        submitBtn.disabled = true;
-                        submitBtn.querySelector('.loading').style.display = 'inline';
-                        submitBtn.querySelector('.normal').style.display = 'none';
-                        
-                        try {{
-                            const response = await fetch('/api/claim/{session_id}', {{
-                                method: 'POST',
-                                headers: {{ 'Content-Type': 'application/json' }},
-                                body: JSON.stringify({{ email: email, nickname: nickname }})
-                            }});
-                            
-                            const data = await response.json();
-                            
-                            if (response.ok) {{
-                                let message = '<div class="success">✅ Score claimed successfully!</div>';
-                                if (data.is_high_score) {{
-                                    message += `<div class="high-score">🎉 High Score Confirmed! You ranked #${{data.rank}}!</div>`;
-                                }}
-                                messageDiv.innerHTML = message;
-                                document.getElementById('claimSection').style.display = 'none';
-                            }} else {{
-                                messageDiv.innerHTML = '<div class="error">❌ ' + data.detail + '</div>';
-                                // Reset button
-                                submitBtn.disabled = false;
-                                submitBtn.querySelector('.loading').style.display = 'none';
-                                submitBtn.querySelector('.normal').style.display = 'inline';
-                            }}
-                        }} catch (err) {{
-                            messageDiv.innerHTML = '<div class="error">❌ Error claiming score. Please try again.</div>';
-                            // Reset button
-                            submitBtn.disabled = false;
-                            submitBtn.querySelector('.loading').style.display = 'none';
-                            submitBtn.querySelector('.normal').style.display = 'inline';
-                        }}
-                    }});
-                </script>
-            </body>
-            </html>
-        """)
+        # Show claim form; the CSS and script are cached static files
+        return templates.TemplateResponse("claim.html", context)
         
+    except DatabaseBusyError:
+        raise
     except Exception as e:
-        logger.error(f"Error displaying claim page: {e}")
+        logger.error("Error displaying claim page: %s", e)
         return HTMLResponse("Internal server error", status_code=500)
 
 @app.post("/api/claim/{session_id}", response_model=ClaimResponse)
 async def claim_score(session_id: str, claim_data: ClaimData):
     """Claim a score with email and nickname"""
     try:
-        # First check if the score exists
-        score = await database.get_score(session_id)
-        if not score:
-            raise HTTPException(status_code=404, detail="Score not found")
+        result = await database.claim_score(session_id, claim_data.email, claim_data.nickname)
         
-        # Check if already claimed
-        if score['email']:
+        if result['status'] == CLAIM_NOT_FOUND:
+            raise HTTPException(status_code=404, detail="Score not found")
+        if result['status'] == CLAIM_ALREADY_CLAIMED:
             raise HTTPException(status_code=400, detail=f"Score has already been claimed")
-        
-        # Check if nickname is already taken
-        nickname_taken = await database.check_nickname_taken(claim_data.nickname, session_id)
-        if nickname_taken:
+        if result['status'] == CLAIM_NICKNAME_TAKEN:
             raise HTTPException(status_code=400, detail=f"Nickname '{claim_data.nickname}' is already taken. Please choose another.")
-        
-        # Claim the score
-        success = await database.claim_score(session_id, claim_data.email, claim_data.nickname)
-        if not success:
+        if result['status'] != CLAIM_OK:
             raise HTTPException(status_code=400, detail="Failed to claim score")
         
-        # Check if it's a high score
-        high_score_info = await database.check_high_score(session_id)
+        # Only cached pages this claim would land on are stale. Plain submissions
+        # never touch the claimed leaderboard, so they don't invalidate anything.
+        leaderboard_cache.invalidate(lambda page: page.admits(result['total_savings']))
+        snapshot_refresher.note_write()
+        change_tracker.note_change(claim=True)
+        leaderboard_broadcaster.notify_change()
         
-        logger.info(f"Score claimed for session {session_id} by '{claim_data.nickname}' ({claim_data.email})")
+        logger.info("Score claimed for session %s by '%s' (%s)", session_id, claim_data.nickname, claim_data.email)
         
         return ClaimResponse(
             success=True,
             message="Score claimed successfully!",
-            is_high_score=high_score_info['is_high_score'] if high_score_info else False,
-            rank=high_score_info['rank'] if high_score_info else None
+            is_high_score=result['is_high_score'],
+            rank=result['rank']
         )
         
-    except HTTPException:
+    except (HTTPException, DatabaseBusyError):
         raise
     except Exception as e:
-        logger.error(f"Error claiming score: {e}")
+        logger.error("Error claiming score: %s", e)
         raise HTTPException(status_code=500, detail="Failed to claim score")
 
+async def load_leaderboard_page(limit: int, after: tuple = None, window: tuple = None) -> LeaderboardPage:
+    """Query and format one page of the claimed leaderboard"""
+    version = live_version(CLAIMS, window)
+    top_scores = await database.get_claimed_leaderboard(limit, after, window)
+    start_rank = after[2] if after else 0
+    
+    # Format the leaderboard response
+    leaderboard = []
+    for i, score in enumerate(top_scores):
+        leaderboard.append({
+            # Snapshot rows carry a precomputed rank
+            "rank": score.get('rank') or start_rank + i + 1,
+            "total_savings": format_money(score['total_savings']),
+            "final_bill": format_money(score['final_bill']),
+            "nickname": score['nickname'],
+            "timestamp": score['timestamp'].isoformat(),
+            "claimed": True  # All these are claimed by definition
+        })
+    
+    # Only offer a next page when this one came back full
+    next_cursor = None
+    if len(top_scores) == limit:
+        last = top_scores[-1]
+        next_cursor = encode_cursor(last['total_savings'], last['id'], leaderboard[-1]['rank'])
+    
+    payload = {"leaderboard": leaderboard, "ranked_by": "total_savings", "next_cursor": next_cursor}
+    snapshot_at = top_scores[0].get('snapshot_at') if top_scores else None
+    if database.snapshot_enabled and window is None:
+        version = snapshot_version(snapshot_at)
+    return LeaderboardPage(
+        limit=limit, rows=top_scores, payload=payload, body=orjson.dumps(payload),
+        snapshot_at=snapshot_at, version=version
+    )
+
+def snapshot_headers(snapshot_at: Optional[datetime], cache_ttl: float) -> dict:
+    """Staleness headers for responses served from the leaderboard snapshot"""
+    if not database.snapshot_enabled:
+        return {}
+    headers = {"X-Leaderboard-Max-Staleness": str(round(snapshot_refresher.max_staleness + cache_ttl))}
+    if snapshot_at:
+        headers["X-Leaderboard-Snapshot-At"] = snapshot_at.isoformat()
+    return headers
+
 @app.get("/api/leaderboard")
-async def get_leaderboard(limit: int = 10):
-    """Get the leaderboard showing only claimed scores with nicknames"""
+async def get_leaderboard(
+    request: Request,
+    limit: int = Query(10, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    event_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """Get the leaderboard showing only claimed scores with nicknames
+
+    ``event_id`` or ``since``/``until`` restrict it to scores played in that window.
+    """
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    window = await resolve_window(event_id, since, until)
+    
+    # Nothing changed since the client's copy: answer from memory
+    version = current_version(CLAIMS, window)
+    if version is not None and is_fresh(request.headers, version):
+        return not_modified(version)
+    
     try:
-        logger.info("Getting leaderboard")
-        all_scores = await database.get_leaderboard()
-        
-        # Filter to only include claimed scores (those with nicknames and emails)
-        claimed_scores = []
-        for score in all_scores:
-            # Only include entries that have been claimed (have nickname and email)
-            # Use .get() to safely access potentially missing fields
-            nickname = score.get('nickname')
-            email = score.get('email')
-            
-            if nickname and email:
-                claimed_scores.append(score)
-        
-        # Sort by total_savings descending (highest savings first)
-        claimed_scores.sort(key=lambda x: x['total_savings'], reverse=True)
-        
-        # Take only the requested limit
-        top_scores = claimed_scores[:limit]
-        
-        # Format the leaderboard response
-        leaderboard = []
-        for i, score in enumerate(top_scores):
-            leaderboard.append({
-                "rank": i + 1,
-                "total_savings": format_money(score['total_savings']),
-                "final_bill": format_money(score['final_bill']),
-                "nickname": score.get('nickname', 'Anonymous'),
-                "timestamp": score['timestamp'].isoformat(),
-                "claimed": True  # All these are claimed by definition
-            })
-        
-        logger.info(f"Returning {len(leaderboard)} claimed scores for leaderboard")
-        return {"leaderboard": leaderboard, "ranked_by": "total_savings"}
-        
+        if after is None:
+            # First pages are what every kiosk polls, so they are cached per limit and window
+            page = await leaderboard_cache.get((limit, window), lambda: load_leaderboard_page(limit, window=window))
+        else:
+            page = await load_leaderboard_page(limit, after, window)
+        # A cached page claims bypassed is still the client's copy
+        if is_fresh(request.headers, page.version):
+            return not_modified(page.version)
+        # Pages are serialized when loaded, so a cache hit does no encoding at all
+        headers = snapshot_headers(page.snapshot_at, leaderboard_cache.ttl) if window is None else {}
+        headers.update(validators(page.version))
+        return Response(page.body, media_type="application/json", headers=headers)
+        
+    except DatabaseBusyError:
+        raise
     except Exception as e:
-        logger.error(f"Error getting leaderboard: {e}")
-        logger.error(f"Error type: {type(e)}")
+        logger.exception("Error getting leaderboard")
         raise HTTPException(status_code=500, detail=f"Failed to get leaderboard: {str(e)}")
 
+async def load_pushed_leaderboard():
+    """Top N entries for the realtime leaderboard push"""
+    size = leaderboard_broadcaster.size
+    page = await leaderboard_cache.get((size, None), lambda: load_leaderboard_page(size))
+    return page.payload["leaderboard"]
+
+@app.websocket("/ws/leaderboard")
+async def leaderboard_ws(websocket: WebSocket):
+    """Push the leaderboard: a snapshot on connect, then deltas as scores are claimed"""
+    await websocket.accept()
+    try:
+        queue = await leaderboard_broadcaster.subscribe()
+    except Exception as e:
+        logger.error("Error subscribing to leaderboard: %s", e)
+        await websocket.close(code=1011)
+        return
+    
+    async def watch_disconnect():
+        # Clients don't send anything; this only returns once they go away
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        leaderboard_broadcaster.unsubscribe(queue)
+        try:
+            queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass  # the next send fails and ends the loop instead
+    
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        while (message := await queue.get()) is not None:
+            await websocket.send_text(message)
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # client went away mid-send
+    finally:
+        leaderboard_broadcaster.unsubscribe(queue)
+        watcher.cancel()
+    
+    if websocket.client_state.name == "CONNECTED":
+        await websocket.close()
+
+@app.get("/api/leaderboard/stream")
+async def leaderboard_stream():
+    """Server-Sent Events alternative to /ws/leaderboard"""
+    try:
+        queue = await leaderboard_broadcaster.subscribe()
+    except Exception as e:
+        logger.error("Error subscribing to leaderboard: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to get leaderboard")
+    
+    async def events():
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                if message is None:
+                    return
+                yield f"data: {message}\n\n"
+        finally:
+            leaderboard_broadcaster.unsubscribe(queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def all_scores_body(rows, start_rank: int, format: str, paginated: bool, limit: Optional[int]):
+    """Render streamed score rows as a JSON array, a paged JSON object or NDJSON"""
+    if format == "json":
+        yield b'{"scores":[' if paginated else b"["
+    separator = b"\n" if format == "ndjson" else b","
+    count = 0
+    last = None
+    async for score in rows:
+        count += 1
+        last = score
+        entry = orjson.dumps({
+            'total_savings': score['total_savings'],
+            'final_bill': score['final_bill'],
+            'rank': score.get('rank') or start_rank + count,
+            'claimed': score['claimed']  # True if claimed, False if not
+        })
+        if format == "ndjson":
+            yield entry + separator
+        else:
+            yield entry if count == 1 else separator + entry
+    
+    next_cursor = None
+    if paginated and count == limit:
+        next_cursor = encode_cursor(last['total_savings'], last['id'], last.get('rank') or start_rank + count)
+    if format == "ndjson":
+        if paginated:
+            yield orjson.dumps({"next_cursor": next_cursor}) + b"\n"
+    elif paginated:
+        yield b"]," + orjson.dumps({"next_cursor": next_cursor})[1:]
+    else:
+        yield b"]"
+    logger.info("Streamed %s total scores", count, extra=SAMPLED)
+
 @app.get("/api/all-scores")
-async def get_all_scores():
-    """Get all scores (claimed and unclaimed) for high score detection"""
+async def get_all_scores(
+    request: Request,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    event_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """Get all scores (claimed and unclaimed) for high score detection
+
+    Streams straight from a server-side cursor. Without ``limit``/``cursor`` the
+    body is the plain JSON array; paged requests get ``{"scores": [...],
+    "next_cursor": ...}`` (or a trailing ``next_cursor`` line for NDJSON).
+    ``event_id`` or ``since``/``until`` stream only the scores played in that window.
+    """
+    after = None
+    start_rank = 0
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        start_rank = after[2]
+    paginated = limit is not None or cursor is not None
+    window = await resolve_window(event_id, since, until)
+    
+    version = current_version(SCORES, window)
+    if version is not None and is_fresh(request.headers, version):
+        return not_modified(version)
+    
     try:
-        logger.info("Getting all scores for high score detection")
-        all_scores = await database.get_leaderboard()
-        
-        # Sort by total_savings descending
-        all_scores.sort(key=lambda x: x['total_savings'], reverse=True)
-        
-        # Add rank to each entry and return minimal data
-        formatted_scores = []
-        for i, score in enumerate(all_scores):
-            formatted_scores.append({
-                'total_savings': score['total_savings'],
-                'final_bill': score['final_bill'],
-                'rank': i + 1,
-                'claimed': bool(score.get('email'))  # True if claimed, False if not
-            })
-        
-        logger.info(f"Returning {len(formatted_scores)} total scores")
-        return formatted_scores
-        
+        first, rows = await prime(database.iter_all_scores(limit, after, window))
+    except DatabaseBusyError:
+        raise
     except Exception as e:
-        logger.error(f"Error getting all scores: {e}")
-        logger.error(f"Error type: {type(e)}")
+        logger.exception("Error getting all scores")
         raise HTTPException(status_code=500, detail=f"Failed to get all scores: {str(e)}")
+    
+    snapshot_at = first.get('snapshot_at') if first else None
+    if database.snapshot_enabled and window is None:
+        # What was actually read, which a replica may serve a refresh behind
+        version = snapshot_version(snapshot_at)
+    
+    body = chunked(all_scores_body(rows, start_rank, format, paginated, limit))
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    headers = snapshot_headers(snapshot_at, 0)
+    headers.update(validators(version))
+    return StreamingResponse(body, media_type=media_type, headers=headers)
 
-@app.get("/api/admin/emails")
-async def get_emails(admin_key: str = None):
-    """Get all collected emails - protected endpoint for business use"""
-    # Simple admin protection - in production use proper authentication
+def require_admin(admin_key: Optional[str]):
+    """Simple admin protection - in production use proper authentication"""
     if admin_key != os.getenv("ADMIN_KEY", "your_secret_admin_key"):
         raise HTTPException(status_code=403, detail="Access denied")
+
+EMAIL_EXPORT_COLUMNS = ["email", "nickname", "total_savings", "final_bill", "claimed_at", "game_played"]
+
+def encode_email_cursor(claimed_at: datetime, score_id: int) -> str:
+    return f"{claimed_at.isoformat()}|{score_id}"
+
+def decode_email_cursor(cursor: str) -> tuple:
+    claimed_at, score_id = cursor.split("|")
+    return datetime.fromisoformat(claimed_at), int(score_id)
+
+async def emails_body(rows, format: str, limit: Optional[int]):
+    """Render streamed claimed rows as JSON, NDJSON or CSV"""
+    if format == "json":
+        yield b'{"emails":['
+    elif format == "csv":
+        yield csv_line(EMAIL_EXPORT_COLUMNS)
+    count = 0
+    last = None
+    async for record in rows:
+        count += 1
+        last = record
+        entry = {
+            "email": record['email'],
+            "nickname": record['nickname'],
+            "total_savings": record['total_savings'],
+            "final_bill": record['final_bill'],
+            "claimed_at": record['claimed_at'].isoformat(),
+            "game_played": record['timestamp'].isoformat()
+        }
+        if format == "csv":
+            yield csv_line(entry.values())
+        elif format == "ndjson":
+            yield orjson.dumps(entry) + b"\n"
+        else:
+            yield orjson.dumps(entry) if count == 1 else b"," + orjson.dumps(entry)
+    
+    next_cursor = None
+    if limit is not None and count == limit:
+        next_cursor = encode_email_cursor(last['claimed_at'], last['id'])
+    if format == "json":
+        yield b"]," + orjson.dumps({"total_emails": count, "next_cursor": next_cursor})[1:]
+    elif format == "ndjson" and limit is not None:
+        yield orjson.dumps({"next_cursor": next_cursor}) + b"\n"
+
+@app.get("/api/admin/emails")
+async def get_emails(
+    admin_key: str = None,
+    format: str = Query("json", pattern="^(json|ndjson|csv)$"),
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None
+):
+    """Get all collected emails - protected endpoint for business use
+
+    Streams from a server-side cursor in constant memory. Pass ``limit`` and
+    the returned ``next_cursor`` to page through the export.
+    """
+    require_admin(admin_key)
+    
+    after = None
+    if cursor:
+        try:
+            after = decode_email_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
     
     try:
-        async with database.pool.acquire() as conn:
-            emails = await conn.fetch("""
-                SELECT email, nickname, total_savings, final_bill, claimed_at, timestamp
-                FROM scores 
-                WHERE email IS NOT NULL 
-                ORDER BY claimed_at DESC
-            """)
-        
-        email_list = []
-        for record in emails:
-            email_list.append({
-                "email": record['email'],
-                "nickname": record['nickname'],
-                "total_savings": record['total_savings'],
-                "final_bill": record['final_bill'],
-                "claimed_at": record['claimed_at'].isoformat(),
-                "game_played": record['timestamp'].isoformat()
-            })
-        
-        return {
-            "total_emails": len(email_list),
-            "emails": email_list
-        }
-        
+        _, rows = await prime(database.iter_claimed_emails(limit, after))
+    except DatabaseBusyError:
+        raise
     except Exception as e:
-        logger.error(f"Error getting emails: {e}")
+        logger.error("Error getting emails: %s", e)
         raise HTTPException(status_code=500, detail="Failed to get emails")
+    
+    body = chunked(emails_body(rows, format, limit))
+    if format == "csv":
+        return StreamingResponse(
+            body,
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="emails.csv"'}
+        )
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    return StreamingResponse(body, media_type=media_type)
+
+@app.put("/api/admin/events/{event_id}")
+async def save_event(event_id: str, event: EventWindow, admin_key: str = None):
+    """Define the time window that ``event_id`` filters select - protected endpoint"""
+    require_admin(admin_key)
+    starts_at, ends_at = to_utc(event.starts_at), to_utc(event.ends_at)
+    if starts_at >= ends_at:
+        raise HTTPException(status_code=400, detail="starts_at must be before ends_at")
+    await database.save_event(event_id, event.name, starts_at, ends_at)
+    return {"event_id": event_id, "name": event.name, "starts_at": starts_at, "ends_at": ends_at}
+
+@app.post("/api/admin/partitions/archive")
+async def archive_partitions(admin_key: str = None, older_than_days: int = Query(30, ge=1)):
+    """Detach daily score partitions older than ``older_than_days`` that hold no claims"""
+    require_admin(admin_key)
+    before = datetime.now(timezone.utc).date() - timedelta(days=older_than_days)
+    detached, kept = await database.archive_partitions(before)
+    if detached:
+        change_tracker.note_change()
+    return {"archived": detached, "kept_with_claims": kept}
+
+@app.get("/api/admin/stats")
+async def get_stats(admin_key: str = None):
+    """Get in-process cache counters - protected endpoint for operators"""
+    require_admin(admin_key)
+    return {"leaderboard_cache": leaderboard_cache.snapshot()}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint (per worker process)"""
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
 
 if __name__ == "__main__":
     import uvicorn
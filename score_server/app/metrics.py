@@ -0,0 +1,195 @@
+import functools
+import inspect
+import logging
+import os
+import random
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Queries slower than this are logged with their parameters; 0 disables
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.5"))
+# Fraction of slow queries that get logged, so a stalled database can't flood the log
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_SAMPLE_RATE", "1.0"))
+SLOW_QUERY_MAX_ARG_CHARS = 200
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route template",
+    ["method", "route", "status"],
+)
+DB_CALL_LATENCY = Histogram(
+    "db_call_duration_seconds", "Time spent in a Database method, including pool waits",
+    ["method"],
+)
+DB_CALL_ERRORS = Counter("db_call_errors_total", "Database method calls that raised", ["method"])
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Time for a single statement round trip",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "Statements that failed or timed out")
+DB_SLOW_QUERIES = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_SECONDS")
+POOL_ACQUIRE_LATENCY = Histogram(
+    "db_pool_acquire_seconds", "Time waiting for a pool connection",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+POOL_WAITERS = Gauge("db_pool_waiters", "Callers currently waiting for a pool connection")
+ADMISSION_REJECTED = Counter(
+    "http_requests_rejected_total", "Requests refused by admission control, by rule and reason (rate or concurrency)",
+    ["rule", "reason"],
+)
+ADMISSION_QUEUED = Counter("http_requests_queued_total", "Requests that waited for a concurrency slot", ["rule"])
+ADMISSION_IN_FLIGHT = Gauge("http_requests_admitted_in_flight", "Requests holding a concurrency slot", ["rule"])
+
+
+def timed(method):
+    """Record latency and errors of a Database method under its name
+
+    Works for coroutines and async generators; a generator is timed from
+    its first row until it is exhausted or closed.
+    """
+    name = method.__name__
+    latency = DB_CALL_LATENCY.labels(name)
+    errors = DB_CALL_ERRORS.labels(name)
+
+    if inspect.isasyncgenfunction(method):
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            rows = method(*args, **kwargs)
+            try:
+                async for item in rows:
+                    yield item
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                # Close the inner generator now so it releases its connection
+                await rows.aclose()
+                latency.observe(time.perf_counter() - started)
+        return wrapper
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+    return wrapper
+
+
+def record_query(record):
+    """asyncpg query logger: time every statement and log slow ones"""
+    DB_QUERY_LATENCY.observe(record.elapsed)
+    if record.exception is not None:
+        DB_QUERY_ERRORS.inc()
+    if SLOW_QUERY_SECONDS and record.elapsed >= SLOW_QUERY_SECONDS:
+        DB_SLOW_QUERIES.inc()
+        if random.random() < SLOW_QUERY_SAMPLE_RATE:
+            args = repr(record.args)
+            if len(args) > SLOW_QUERY_MAX_ARG_CHARS:
+                args = args[:SLOW_QUERY_MAX_ARG_CHARS] + "..."
+            statement = " ".join(record.query.split())
+            logger.warning("Slow query (%.0f ms): %s args=%s", record.elapsed * 1000, statement, args)
+
+
+class PoolCollector:
+    """Reports asyncpg pool occupancy at scrape time, for the primary and any replica"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def collect(self):
+        families = [
+            GaugeMetricFamily("db_pool_size", "Open connections in the pool", labels=["pool"]),
+            GaugeMetricFamily("db_pool_idle", "Open connections not in use", labels=["pool"]),
+            GaugeMetricFamily("db_pool_in_use", "Connections currently checked out", labels=["pool"]),
+            GaugeMetricFamily("db_pool_max_size", "Configured pool ceiling", labels=["pool"]),
+        ]
+        for name, pool in (("primary", self.db.pool), ("replica", self.db.read_pool)):
+            if pool is None:
+                continue
+            size = pool.get_size()
+            idle = pool.get_idle_size()
+            for family, value in zip(families, (size, idle, size - idle, pool.get_max_size())):
+                family.add_metric([name], value)
+        yield from families
+
+
+class CacheCollector:
+    """Exposes LeaderboardCache counters at scrape time"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def collect(self):
+        stats = self.cache.snapshot()
+        for key, doc in (
+            ("hits", "Reads served from the cache"),
+            ("misses", "Reads that had to load"),
+            ("coalesced", "Misses that joined a load already in flight"),
+            ("loads", "Loads issued to the database"),
+            ("evictions", "Entries dropped to stay under max_entries"),
+        ):
+            yield CounterMetricFamily(f"leaderboard_cache_{key}", doc, value=stats[key])
+        yield GaugeMetricFamily("leaderboard_cache_entries", "Cached pages", value=stats["size"])
+        yield GaugeMetricFamily(
+            "leaderboard_cache_hit_ratio", "Hits over all lookups since start",
+            value=stats["hit_ratio"] or 0,
+        )
+
+
+def register_collectors(db, cache):
+    REGISTRY.register(PoolCollector(db))
+    REGISTRY.register(CacheCollector(cache))
+
+
+def render_metrics():
+    """Current metrics in the Prometheus text format, with its content type"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template
+
+    The route template (``/claim/{session_id}``), not the raw path, is the
+    label so cardinality stays bounded. Event streams are skipped since
+    their duration is the subscriber's connection time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for key, value in message.get("headers", ()):
+                    if key.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                        streaming = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not streaming:
+                route = scope.get("route")
+                label = route.path if route is not None else scope.get("root_path") or "unmatched"
+                REQUEST_LATENCY.labels(scope["method"], label, str(status)).observe(
+                    time.perf_counter() - started
+                )
@@ -0,0 +1,539 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import List
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key for pg_advisory_lock so only one worker migrates at a time
+MIGRATION_LOCK_ID = 7_404_551
+LOCK_POLL_INTERVAL = 0.5
+# Index builds on a large table can take far longer than the pool's command timeout
+MIGRATION_STATEMENT_TIMEOUT = 3600
+# Key for pg_advisory_xact_lock inside create_score_partition()
+PARTITION_LOCK_ID = 7_404_553
+
+
+@dataclass
+class Migration:
+    version: int
+    description: str
+    statements: List[str]
+    # CONCURRENTLY statements can't run inside a transaction, so these are
+    # executed one by one and the version is recorded afterwards
+    concurrent: bool = False
+
+
+MIGRATIONS = [
+    Migration(1, "Create scores table", [
+        """
+        CREATE TABLE IF NOT EXISTS scores (
+            id SERIAL PRIMARY KEY,
+            session_id VARCHAR(50) UNIQUE NOT NULL,
+            final_bill INTEGER NOT NULL,
+            total_savings INTEGER NOT NULL,
+            timestamp TIMESTAMP NOT NULL,
+            email VARCHAR(255),
+            claimed_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "ALTER TABLE scores ADD COLUMN IF NOT EXISTS nickname VARCHAR(25)",
+        "CREATE INDEX IF NOT EXISTS idx_session_id ON scores(session_id)",
+        "CREATE INDEX IF NOT EXISTS idx_total_savings_desc ON scores(total_savings DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_claimed ON scores(email) WHERE email IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_timestamp ON scores(timestamp DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_email ON scores(email) WHERE email IS NOT NULL",
+    ]),
+    # Partial covering index for the public (claimed) leaderboard so the
+    # top-N and keyset pages are served from the index alone
+    Migration(2, "Claimed leaderboard covering index", [
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_claimed_leaderboard
+        ON scores(total_savings DESC, id DESC)
+        INCLUDE (final_bill, nickname, timestamp)
+        WHERE email IS NOT NULL AND nickname IS NOT NULL
+        """,
+    ], concurrent=True),
+    # Keyset indexes for the streamed all-scores and email exports
+    Migration(3, "Keyset indexes for streamed exports", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_savings_id_desc ON scores(total_savings DESC, id DESC)",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_claimed_at_id_desc
+        ON scores(claimed_at DESC, id DESC) WHERE email IS NOT NULL
+        """,
+    ], concurrent=True),
+    # Claims that raced before uniqueness was enforced may share a nickname
+    # (ignoring case); keep the earliest claim and suffix the later ones
+    Migration(4, "Deduplicate nicknames ignoring case", [
+        """
+        UPDATE scores SET nickname = left(nickname, 17) || '-' || right(id::text, 7)
+        FROM (
+            SELECT id AS dup_id, ROW_NUMBER() OVER (
+                PARTITION BY lower(nickname) ORDER BY claimed_at, id
+            ) AS n
+            FROM scores WHERE nickname IS NOT NULL
+        ) dups
+        WHERE scores.id = dups.dup_id AND dups.n > 1
+        """,
+    ]),
+    # Case-insensitive nickname uniqueness, enforced by the database so
+    # concurrent claims can't both take the same nickname
+    Migration(5, "Unique case-insensitive nickname index", [
+        """
+        CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_nickname_lower_unique
+        ON scores(lower(nickname)) WHERE nickname IS NOT NULL
+        """,
+    ], concurrent=True),
+    # Nickname lookups are case-insensitive, so the index on the raw column is never used
+    Migration(6, "Drop unused raw nickname index", [
+        "DROP INDEX CONCURRENTLY IF EXISTS idx_nickname",
+    ], concurrent=True),
+    # Precomputed ranks for LEADERBOARD_SNAPSHOT mode, filled by the refresher
+    Migration(7, "Leaderboard snapshot materialized view", [
+        """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS leaderboard_snapshot AS
+        SELECT
+            id,
+            final_bill,
+            total_savings,
+            nickname,
+            timestamp,
+            email IS NOT NULL AS claimed,
+            ROW_NUMBER() OVER (ORDER BY total_savings DESC, id DESC) AS rank,
+            CASE WHEN email IS NOT NULL AND nickname IS NOT NULL THEN
+                ROW_NUMBER() OVER (
+                    PARTITION BY email IS NOT NULL AND nickname IS NOT NULL
+                    ORDER BY total_savings DESC, id DESC
+                )
+            END AS claimed_rank
+        FROM scores
+        WITH NO DATA
+        """,
+        # REFRESH ... CONCURRENTLY requires a unique index
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_snapshot_id ON leaderboard_snapshot(id)",
+        "CREATE INDEX IF NOT EXISTS idx_snapshot_rank ON leaderboard_snapshot(rank)",
+        """
+        CREATE INDEX IF NOT EXISTS idx_snapshot_claimed_rank
+        ON leaderboard_snapshot(claimed_rank) WHERE claimed_rank IS NOT NULL
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS leaderboard_snapshot_meta (
+            id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+            refreshed_at TIMESTAMP
+        )
+        """,
+        "INSERT INTO leaderboard_snapshot_meta (id) VALUES (TRUE) ON CONFLICT DO NOTHING",
+    ]),
+    # Publish score inserts and claims so every worker can update its in-process
+    # state. Payloads are "<op>:<id>:<total_savings>"; the id keeps them distinct,
+    # since Postgres folds identical notifications within a transaction.
+    Migration(8, "Notify score changes", [
+        """
+        CREATE OR REPLACE FUNCTION notify_score_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM pg_notify('score_events', 'i:' || NEW.id || ':' || NEW.total_savings);
+            ELSIF NEW.email IS DISTINCT FROM OLD.email OR NEW.nickname IS DISTINCT FROM OLD.nickname THEN
+                PERFORM pg_notify('score_events', 'c:' || NEW.id || ':' || NEW.total_savings);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS scores_notify ON scores",
+        """
+        CREATE TRIGGER scores_notify AFTER INSERT OR UPDATE ON scores
+        FOR EACH ROW EXECUTE FUNCTION notify_score_change()
+        """,
+    ]),
+    # Range-partition scores by day (UTC) so event and daily queries prune to a
+    # few partitions and old days can be detached instead of deleted. Unique
+    # constraints on a partitioned table must include the partition key, so
+    # global session and nickname uniqueness move to small registry tables.
+    Migration(9, "Partition scores by day", [
+        "ALTER TABLE scores RENAME TO scores_unpartitioned",
+        # Keep the id sequence alive when the old table is dropped
+        "ALTER SEQUENCE scores_id_seq OWNED BY NONE",
+        """
+        CREATE TABLE scores (
+            id INTEGER NOT NULL DEFAULT nextval('scores_id_seq'),
+            session_id VARCHAR(50) NOT NULL,
+            final_bill INTEGER NOT NULL,
+            total_savings INTEGER NOT NULL,
+            timestamp TIMESTAMP NOT NULL,
+            email VARCHAR(255),
+            claimed_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            nickname VARCHAR(25)
+        ) PARTITION BY RANGE (timestamp)
+        """,
+        "ALTER SEQUENCE scores_id_seq OWNED BY scores.id",
+        # Catches rows outside every daily partition rather than failing the insert
+        "CREATE TABLE scores_default PARTITION OF scores DEFAULT",
+        f"""
+        CREATE OR REPLACE FUNCTION create_score_partition(day date) RETURNS text AS $$
+        DECLARE
+            name text := 'scores_p' || to_char(day, 'YYYYMMDD');
+        BEGIN
+            -- Workers create the same partitions at startup; serialize them
+            PERFORM pg_advisory_xact_lock({PARTITION_LOCK_ID});
+            IF to_regclass(name) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF scores FOR VALUES FROM (%L) TO (%L)',
+                    name, day, day + 1
+                );
+            END IF;
+            RETURN name;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        SELECT create_score_partition(day::date)
+        FROM (SELECT DISTINCT date_trunc('day', timestamp) AS day FROM scores_unpartitioned) days
+        """,
+        "SELECT create_score_partition((now() AT TIME ZONE 'utc')::date)",
+        """
+        INSERT INTO scores (id, session_id, final_bill, total_savings, timestamp,
+                            email, claimed_at, created_at, nickname)
+        SELECT id, session_id, final_bill, total_savings, timestamp,
+            email, claimed_at, created_at, nickname
+        FROM scores_unpartitioned
+        """,
+        # Also records each session's partition key, so lookups by session prune
+        """
+        CREATE TABLE score_sessions (
+            session_id VARCHAR(50) PRIMARY KEY,
+            timestamp TIMESTAMP NOT NULL
+        )
+        """,
+        "INSERT INTO score_sessions SELECT session_id, timestamp FROM scores_unpartitioned",
+        """
+        CREATE TABLE score_nicknames (
+            nickname_key VARCHAR(25) PRIMARY KEY,
+            session_id VARCHAR(50) NOT NULL
+        )
+        """,
+        """
+        INSERT INTO score_nicknames
+        SELECT lower(nickname), session_id FROM scores_unpartitioned WHERE nickname IS NOT NULL
+        """,
+        # Takes the snapshot view and the notify trigger with it; both are recreated below
+        "DROP TABLE scores_unpartitioned CASCADE",
+        "ALTER TABLE scores ADD PRIMARY KEY (id, timestamp)",
+        "CREATE INDEX idx_session_id ON scores(session_id)",
+        "CREATE INDEX idx_total_savings_desc ON scores(total_savings DESC)",
+        "CREATE INDEX idx_claimed ON scores(email) WHERE email IS NOT NULL",
+        "CREATE INDEX idx_timestamp ON scores(timestamp DESC)",
+        "CREATE INDEX idx_email ON scores(email) WHERE email IS NOT NULL",
+        """
+        CREATE INDEX idx_claimed_leaderboard
+        ON scores(total_savings DESC, id DESC)
+        INCLUDE (final_bill, nickname, timestamp)
+        WHERE email IS NOT NULL AND nickname IS NOT NULL
+        """,
+        "CREATE INDEX idx_savings_id_desc ON scores(total_savings DESC, id DESC)",
+        "CREATE INDEX idx_claimed_at_id_desc ON scores(claimed_at DESC, id DESC) WHERE email IS NOT NULL",
+        """
+        CREATE MATERIALIZED VIEW leaderboard_snapshot AS
+        SELECT
+            id,
+            final_bill,
+            total_savings,
+            nickname,
+            timestamp,
+            email IS NOT NULL AS claimed,
+            ROW_NUMBER() OVER (ORDER BY total_savings DESC, id DESC) AS rank,
+            CASE WHEN email IS NOT NULL AND nickname IS NOT NULL THEN
+                ROW_NUMBER() OVER (
+                    PARTITION BY email IS NOT NULL AND nickname IS NOT NULL
+                    ORDER BY total_savings DESC, id DESC
+                )
+            END AS claimed_rank
+        FROM scores
+        WITH NO DATA
+        """,
+        "CREATE UNIQUE INDEX idx_snapshot_id ON leaderboard_snapshot(id)",
+        "CREATE INDEX idx_snapshot_rank ON leaderboard_snapshot(rank)",
+        """
+        CREATE INDEX idx_snapshot_claimed_rank
+        ON leaderboard_snapshot(claimed_rank) WHERE claimed_rank IS NOT NULL
+        """,
+        "UPDATE leaderboard_snapshot_meta SET refreshed_at = NULL",
+        """
+        CREATE TRIGGER scores_notify AFTER INSERT OR UPDATE ON scores
+        FOR EACH ROW EXECUTE FUNCTION notify_score_change()
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS events (
+            event_id VARCHAR(50) PRIMARY KEY,
+            name VARCHAR(255),
+            starts_at TIMESTAMP NOT NULL,
+            ends_at TIMESTAMP NOT NULL,
+            CHECK (ends_at > starts_at)
+        )
+        """,
+    ]),
+    # Claiming used to UPDATE the scores row, leaving a dead tuple and fresh
+    # entries in every index of a table that otherwise only grows. Scores are
+    # now append-only in score_entries, claims are inserted into their own
+    # table, and a ``scores`` view joins the two for existing queries. Postgres
+    # removes the join when a query reads no claim column.
+    Migration(10, "Split claims from scores", [
+        # Both depend on the claim columns; recreated below
+        "DROP MATERIALIZED VIEW leaderboard_snapshot",
+        "DROP TRIGGER scores_notify ON scores",
+        "ALTER TABLE scores RENAME TO score_entries",
+        f"""
+        CREATE OR REPLACE FUNCTION create_score_partition(day date) RETURNS text AS $$
+        DECLARE
+            name text := 'scores_p' || to_char(day, 'YYYYMMDD');
+        BEGIN
+            -- Workers create the same partitions at startup; serialize them
+            PERFORM pg_advisory_xact_lock({PARTITION_LOCK_ID});
+            IF to_regclass(name) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF score_entries FOR VALUES FROM (%L) TO (%L)',
+                    name, day, day + 1
+                );
+            END IF;
+            RETURN name;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        # The score columns are copied from score_entries, whose rows never
+        # change, so the claimed leaderboard and exports read claims alone
+        """
+        CREATE TABLE claims (
+            score_id INTEGER PRIMARY KEY,
+            session_id VARCHAR(50) NOT NULL,
+            email VARCHAR(255) NOT NULL,
+            nickname VARCHAR(25),
+            claimed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            final_bill INTEGER NOT NULL,
+            total_savings INTEGER NOT NULL,
+            timestamp TIMESTAMP NOT NULL,
+            FOREIGN KEY (score_id, timestamp) REFERENCES score_entries (id, timestamp)
+        )
+        """,
+        """
+        INSERT INTO claims (score_id, session_id, email, nickname, claimed_at,
+                            final_bill, total_savings, timestamp)
+        SELECT id, session_id, email, nickname, claimed_at, final_bill, total_savings, timestamp
+        FROM score_entries WHERE email IS NOT NULL
+        """,
+        # Replaces the score_nicknames registry
+        "CREATE UNIQUE INDEX idx_claims_nickname_lower ON claims(lower(nickname))",
+        "CREATE INDEX idx_claims_email ON claims(email)",
+        """
+        CREATE INDEX idx_claims_leaderboard
+        ON claims(total_savings DESC, score_id DESC)
+        INCLUDE (final_bill, nickname, timestamp)
+        WHERE nickname IS NOT NULL
+        """,
+        "CREATE INDEX idx_claims_claimed_at ON claims(claimed_at DESC, score_id DESC)",
+        "DROP TABLE score_nicknames",
+        # Claim indexes move to claims; idx_claimed duplicated idx_email,
+        # idx_total_savings_desc is a prefix of idx_savings_id_desc, and session
+        # lookups go through score_sessions and prune to one partition
+        "DROP INDEX idx_claimed, idx_email, idx_claimed_leaderboard, idx_claimed_at_id_desc",
+        "DROP INDEX idx_total_savings_desc, idx_session_id",
+        "ALTER TABLE score_entries DROP COLUMN email, DROP COLUMN claimed_at, DROP COLUMN nickname",
+        """
+        CREATE VIEW scores AS
+        SELECT s.id, s.session_id, s.final_bill, s.total_savings, s.timestamp,
+            c.email, c.claimed_at, s.created_at, c.nickname
+        FROM score_entries s
+        LEFT JOIN claims c ON c.score_id = s.id
+        """,
+        """
+        CREATE MATERIALIZED VIEW leaderboard_snapshot AS
+        SELECT
+            id,
+            final_bill,
+            total_savings,
+            nickname,
+            timestamp,
+            email IS NOT NULL AS claimed,
+            ROW_NUMBER() OVER (ORDER BY total_savings DESC, id DESC) AS rank,
+            CASE WHEN email IS NOT NULL AND nickname IS NOT NULL THEN
+                ROW_NUMBER() OVER (
+                    PARTITION BY email IS NOT NULL AND nickname IS NOT NULL
+                    ORDER BY total_savings DESC, id DESC
+                )
+            END AS claimed_rank
+        FROM scores
+        WITH NO DATA
+        """,
+        "CREATE UNIQUE INDEX idx_snapshot_id ON leaderboard_snapshot(id)",
+        "CREATE INDEX idx_snapshot_rank ON leaderboard_snapshot(rank)",
+        """
+        CREATE INDEX idx_snapshot_claimed_rank
+        ON leaderboard_snapshot(claimed_rank) WHERE claimed_rank IS NOT NULL
+        """,
+        "UPDATE leaderboard_snapshot_meta SET refreshed_at = NULL",
+        # Both tables are insert-only now, so an insert into either is the event
+        """
+        CREATE OR REPLACE FUNCTION notify_score_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'claims' THEN
+                PERFORM pg_notify('score_events', 'c:' || NEW.score_id || ':' || NEW.total_savings);
+            ELSE
+                PERFORM pg_notify('score_events', 'i:' || NEW.id || ':' || NEW.total_savings);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER scores_notify AFTER INSERT ON score_entries
+        FOR EACH ROW EXECUTE FUNCTION notify_score_change()
+        """,
+        """
+        CREATE TRIGGER claims_notify AFTER INSERT ON claims
+        FOR EACH ROW EXECUTE FUNCTION notify_score_change()
+        """,
+    ]),
+    Migration(11, "Tag score events with the writer's origin", [
+        # The app's pool connections set inkless.origin, so each worker can
+        # recognize its own events; other writers leave it empty
+        """
+        CREATE OR REPLACE FUNCTION notify_score_change() RETURNS trigger AS $$
+        DECLARE
+            origin text := coalesce(current_setting('inkless.origin', true), '');
+        BEGIN
+            IF TG_TABLE_NAME = 'claims' THEN
+                PERFORM pg_notify('score_events', 'c:' || NEW.score_id || ':' || NEW.total_savings || ':' || origin);
+            ELSE
+                PERFORM pg_notify('score_events', 'i:' || NEW.id || ':' || NEW.total_savings || ':' || origin);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+    ]),
+    # CREATE TABLE ... PARTITION OF takes ACCESS EXCLUSIVE on score_entries, so
+    # while it waits for a long read every submit queues behind it. A table
+    # created on its own and then attached only needs SHARE UPDATE EXCLUSIVE.
+    Migration(12, "Attach new score partitions instead of creating them in place", [
+        f"""
+        CREATE OR REPLACE FUNCTION create_score_partition(day date) RETURNS text AS $$
+        DECLARE
+            name text := 'scores_p' || to_char(day, 'YYYYMMDD');
+        BEGIN
+            -- Workers create the same partitions at startup; serialize them
+            PERFORM pg_advisory_xact_lock({PARTITION_LOCK_ID});
+            IF to_regclass(name) IS NULL THEN
+                EXECUTE format(
+                    'CREATE TABLE %I (LIKE score_entries INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', name
+                );
+                EXECUTE format(
+                    'ALTER TABLE score_entries ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    name, day, day + 1
+                );
+            END IF;
+            RETURN name;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+    ]),
+    # Workers cache event windows; any change to an event tells them to drop it
+    Migration(13, "Notify on event changes", [
+        """
+        CREATE OR REPLACE FUNCTION notify_event_change() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('event_changes', OLD.event_id);
+            ELSE
+                PERFORM pg_notify('event_changes', NEW.event_id);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER events_notify AFTER INSERT OR UPDATE OR DELETE ON events
+        FOR EACH ROW EXECUTE FUNCTION notify_event_change()
+        """,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def current_version(conn) -> int:
+    """Highest applied migration, or 0 on a database that was never migrated"""
+    try:
+        return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    except asyncpg.UndefinedTableError:
+        return 0
+
+
+async def migrate(pool) -> int:
+    """Bring the schema up to LATEST_VERSION
+
+    Boots against an up-to-date schema cost a single version query. Otherwise
+    the worker takes an advisory lock so concurrent workers wait instead of
+    running the same DDL, then re-checks and applies what is still missing.
+    """
+    async with pool.acquire() as conn:
+        version = await current_version(conn)
+        if version >= LATEST_VERSION:
+            return version
+
+        # Poll instead of blocking in pg_advisory_lock: a waiting session holds
+        # a snapshot, which CREATE INDEX CONCURRENTLY in the migrating worker
+        # would wait on in turn (a deadlock)
+        while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATION_LOCK_ID):
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+        try:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            version = await current_version(conn)
+            for migration in MIGRATIONS:
+                if migration.version > version:
+                    await _apply(conn, migration)
+                    version = migration.version
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+    return version
+
+
+async def _apply(conn, migration: Migration):
+    logger.info("Applying migration %s: %s", migration.version, migration.description)
+    if migration.concurrent:
+        # A concurrent build that was interrupted leaves an INVALID index behind,
+        # which IF NOT EXISTS would silently accept
+        await _drop_invalid_indexes(conn)
+        for statement in migration.statements:
+            await conn.execute(statement, timeout=MIGRATION_STATEMENT_TIMEOUT)
+        await _record(conn, migration)
+    else:
+        async with conn.transaction():
+            for statement in migration.statements:
+                await conn.execute(statement, timeout=MIGRATION_STATEMENT_TIMEOUT)
+            await _record(conn, migration)
+
+
+async def _record(conn, migration: Migration):
+    await conn.execute("""
+        INSERT INTO schema_version (version, description) VALUES ($1, $2)
+    """, migration.version, migration.description)
+
+
+async def _drop_invalid_indexes(conn):
+    invalid = await conn.fetch("""
+        SELECT indexrelid::regclass::text AS name FROM pg_index
+        WHERE indrelid::regclass::text IN ('scores', 'score_entries', 'claims') AND NOT indisvalid
+    """)
+    for row in invalid:
+        logger.warning("Dropping invalid index %s left by an interrupted build", row['name'])
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {row['name']}")
@@ -1,14 +1,34 @@
-from pydantic import BaseModel, EmailStr, validator
+from pydantic import BaseModel, EmailStr, Field, validator
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 import re
 
 class ScoreSubmission(BaseModel):
-    session_id: str
+    # Matches the session_id column, so a bad ID fails validation rather than the insert
+    session_id: str = Field(min_length=1, max_length=50)
     final_bill: int
     total_savings: int
     timestamp: str
 
+def clean_nickname(v: str) -> str:
+    """Strip and validate a leaderboard nickname, raising ValueError if unusable"""
+    v = v.strip()
+    
+    if len(v) < 2:
+        raise ValueError('Nickname must be at least 2 characters long')
+    if len(v) > 20:
+        raise ValueError('Nickname must be 20 characters or less')
+    
+    # Allow letters, numbers, spaces, and basic symbols
+    if not re.match(r'^[a-zA-Z0-9\s\-_.!]+$', v):
+        raise ValueError('Nickname contains invalid characters')
+        
+    # Prevent all spaces/symbols
+    if not re.search(r'[a-zA-Z0-9]', v):
+        raise ValueError('Nickname must contain at least one letter or number')
+
+    return v
+
 class ClaimData(BaseModel):
     email: EmailStr
     nickname: str
@@ -16,35 +36,61 @@ class ClaimData(BaseModel):
     @validator('nickname')
     def validate_nickname(cls, v):
         # Clean and validate nickname
-        v = v.strip()
-        
-        if len(v) < 2:
-            raise ValueError('Nickname must be at least 2 characters long')
-        if len(v) > 20:
-            raise ValueError('Nickname must be 20 characters or less')
-        
-        # Allow letters, numbers, spaces, and basic symbols
-        if not re.match(r'^[a-zA-Z0-9\s\-_.!]+$', v):
-            raise ValueError('Nickname contains invalid characters')
-            
-        # Prevent all spaces/symbols
-        if not re.search(r'[a-zA-Z0-9]', v):
-            raise ValueError('Nickname must contain at least one letter or number')
-            
-        return v
+        return clean_nickname(v)
 
 class ScoreResponse(BaseModel):
     success: bool
     session_id: str
     message: str
+    is_high_score: Optional[bool] = None
+    rank: Optional[int] = None
+    percentile: Optional[float] = None
+    total_scores: Optional[int] = None
+
+class ScoreBatchResult(BaseModel):
+    session_id: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+    is_high_score: Optional[bool] = None
+    rank: Optional[int] = None
+    percentile: Optional[float] = None
+    total_scores: Optional[int] = None
+
+class ScoreBatchResponse(BaseModel):
+    created: int
+    existing: int
+    invalid: int
+    results: List[ScoreBatchResult]
 
 class HighScoreCheck(BaseModel):
     is_high_score: bool
     rank: Optional[int] = None
+    percentile: Optional[float] = None
     total_scores: Optional[int] = None
 
+class HistogramBucket(BaseModel):
+    min_savings: int
+    max_savings: int
+    count: int
+
+class ScoreDistribution(BaseModel):
+    total_scores: int
+    buckets: List[HistogramBucket]
+    percentiles: Dict[str, Optional[int]]
+    high_score_threshold: Optional[int] = None
+
 class ClaimResponse(BaseModel):
     success: bool
     message: str
     is_high_score: Optional[bool] = None
-    rank: Optional[int] = None
\ No newline at end of file
+    rank: Optional[int] = None
+
+class EventWindow(BaseModel):
+    name: Optional[str] = None
+    starts_at: datetime
+    ends_at: datetime
+
+class NicknameAvailability(BaseModel):
+    nickname: str
+    available: bool
+    reason: Optional[str] = None
\ No newline at end of file
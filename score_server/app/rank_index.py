@@ -0,0 +1,125 @@
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Tuple
+
+
+class RankIndex:
+    """In-memory ranking over total savings
+
+    Keeps one counter per distinct savings value in a Fenwick tree, so rank and
+    threshold lookups are O(log D) where D is the number of distinct values
+    (far smaller than the number of scores). Adding a score with a value already
+    seen is O(log D); a brand new value rebuilds the tree in O(D).
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self.total = 0
+        self._values = []  # distinct savings, ascending
+        self._counts = []  # scores per distinct value
+        self._tree = [0]   # 1-based Fenwick tree over _counts
+
+    def load(self, value_counts: Iterable[Tuple[int, int]]):
+        """Replace the contents with (total_savings, count) pairs"""
+        pairs = sorted(value_counts)
+        self._values = [value for value, _ in pairs]
+        self._counts = [count for _, count in pairs]
+        self.total = sum(self._counts)
+        self._rebuild()
+        self.loaded = True
+
+    def add(self, total_savings: int, count: int = 1):
+        """Record new scores with the given savings"""
+        i = bisect_left(self._values, total_savings)
+        if i < len(self._values) and self._values[i] == total_savings:
+            self._counts[i] += count
+            self._update(i + 1, count)
+        else:
+            self._values.insert(i, total_savings)
+            self._counts.insert(i, count)
+            self._rebuild()
+        self.total += count
+
+    def rank(self, total_savings: int) -> int:
+        """1-based rank of a score: one more than the number of strictly better scores"""
+        return self.total - self._prefix(bisect_right(self._values, total_savings)) + 1
+
+    def high_score_cutoff(self, fraction: float = 0.1) -> float:
+        """Largest rank that still counts as a high score"""
+        return max(1, self.total * fraction)
+
+    def high_score_threshold(self, fraction: float = 0.1):
+        """Lowest savings that currently ranks as a high score, or None when empty"""
+        if not self.total:
+            return None
+        # rank(v) = total - prefix(v) + 1 <= cutoff  <=>  prefix(v) >= total + 1 - cutoff
+        return self._values[self._search(self.total + 1 - self.high_score_cutoff(fraction))]
+
+    def is_high_score(self, total_savings: int, fraction: float = 0.1) -> bool:
+        return self.rank(total_savings) <= self.high_score_cutoff(fraction)
+
+    def percentile(self, total_savings: int) -> float:
+        """Share of scores (0-100) at or below this savings value, so ties rank alike"""
+        if not self.total:
+            return 100.0
+        return 100 * self._prefix(bisect_right(self._values, total_savings)) / self.total
+
+    def value_at_percentile(self, percentile: float):
+        """Lowest savings with at least ``percentile`` percent of scores at or below it"""
+        if not self.total:
+            return None
+        return self._values[self._search(max(1, self.total * percentile / 100))]
+
+    def histogram(self, buckets: int) -> List[Tuple[int, int, int]]:
+        """(low, high, count) for up to ``buckets`` equal-width savings ranges
+
+        Each bucket is one prefix query, so this is O(buckets * log D) however
+        many scores there are.
+        """
+        if not self.total:
+            return []
+        low, high = self._values[0], self._values[-1]
+        width = -(-(high - low + 1) // buckets)
+        result = []
+        below = 0
+        while low <= high:
+            upper = low + width - 1
+            upto = self._prefix(bisect_right(self._values, upper))
+            result.append((low, min(upper, high), upto - below))
+            below = upto
+            low = upper + 1
+        return result
+
+    def _rebuild(self):
+        n = len(self._counts)
+        tree = [0] + self._counts
+        for i in range(1, n + 1):
+            parent = i + (i & -i)
+            if parent <= n:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _update(self, i: int, delta: int):
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i: int) -> int:
+        """Number of scores among the i smallest distinct values"""
+        result = 0
+        while i > 0:
+            result += self._tree[i]
+            i -= i & -i
+        return result
+
+    def _search(self, target: float) -> int:
+        """Index of the smallest value whose prefix count reaches target"""
+        pos = 0
+        remaining = target
+        step = 1 << len(self._tree).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] < remaining:
+                pos = nxt
+                remaining -= self._tree[nxt]
+            step >>= 1
+        return min(pos, len(self._values) - 1)
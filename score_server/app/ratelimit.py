@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+from .metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_REJECTED
+
+logger = logging.getLogger(__name__)
+
+# Client buckets kept per worker; the least recently seen are forgotten first
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+# Proxies in front of the app that append to X-Forwarded-For; 0 uses the socket address
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "0"))
+# Requests that find every slot of a capped route busy wait this long, this many at a time
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "4"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "1"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+
+
+def parse_rate(value: str) -> Optional[Tuple[int, float]]:
+    """``"10/60"`` (10 requests per 60 seconds) as ``(10, 60.0)``; empty or ``0`` disables"""
+    if not value or value.strip() == "0":
+        return None
+    count, _, seconds = value.partition("/")
+    return int(count), float(seconds or 1)
+
+
+@dataclass
+class Rule:
+    name: str
+    method: str
+    path: str
+    # Per client: bursts of up to ``count`` requests, refilled evenly over ``seconds``
+    rate: Optional[Tuple[int, float]] = None
+    # In-flight requests per worker; 0 means uncapped
+    concurrency: int = 0
+
+
+def default_rules():
+    return [
+        Rule("submit", "POST", "/api/scores", rate=parse_rate(os.getenv("RATE_LIMIT_SUBMIT", "60/60"))),
+        Rule("submit_batch", "POST", "/api/scores/batch",
+             rate=parse_rate(os.getenv("RATE_LIMIT_SUBMIT_BATCH", "20/60"))),
+        Rule("all_scores", "GET", "/api/all-scores",
+             rate=parse_rate(os.getenv("RATE_LIMIT_ALL_SCORES", "30/60")),
+             concurrency=int(os.getenv("ADMISSION_ALL_SCORES_CONCURRENCY", "2"))),
+        Rule("admin_emails", "GET", "/api/admin/emails",
+             concurrency=int(os.getenv("ADMISSION_ADMIN_EMAILS_CONCURRENCY", "1"))),
+    ]
+
+
+class ConcurrencyLimit:
+    """Caps in-flight requests, letting a few wait briefly for a slot"""
+
+    def __init__(self, rule: Rule, queue_size: int, timeout: float):
+        self.rule = rule
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.waiting = 0
+        self._slots = asyncio.Semaphore(rule.concurrency)
+
+    async def acquire(self) -> bool:
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return True
+        if self.waiting >= self.queue_size:
+            return False
+
+        ADMISSION_QUEUED.labels(self.rule.name).inc()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self._slots.release()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying per-client rate limits and per-route concurrency caps
+
+    A request matching a rule spends a token from its client's bucket for
+    that rule, or is refused with 429. Routes with a concurrency cap then
+    take a slot, held until the response (streamed bodies included) is
+    finished; when none frees up in time the request is refused with 503.
+    Both happen before the route runs, so refused requests never wait for
+    a database connection.
+    """
+
+    def __init__(self, app, rules=None, max_clients: int = RATE_LIMIT_MAX_CLIENTS,
+                 proxy_hops: int = RATE_LIMIT_PROXY_HOPS):
+        self.app = app
+        self.rules = {(rule.method, rule.path): rule for rule in (rules or default_rules())}
+        self.max_clients = max_clients
+        self.proxy_hops = proxy_hops
+        self._warned_forwarded = False
+        self._buckets = OrderedDict()  # (rule name, client) -> [tokens, last refill]
+        self._limits = {
+            rule.name: ConcurrencyLimit(rule, ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT)
+            for rule in self.rules.values() if rule.concurrency > 0
+        }
+
+    async def __call__(self, scope, receive, send):
+        rule = self.rules.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        if rule.rate:
+            wait = self._take_token(rule, self.client_address(scope))
+            if wait:
+                ADMISSION_REJECTED.labels(rule.name, "rate").inc()
+                response = JSONResponse(
+                    {"detail": "Too many requests, please slow down"},
+                    status_code=429,
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+                await response(scope, receive, send)
+                return
+
+        limit = self._limits.get(rule.name)
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await limit.acquire():
+            ADMISSION_REJECTED.labels(rule.name, "concurrency").inc()
+            response = JSONResponse(
+                {"detail": "Score server is busy, please retry"},
+                status_code=503,
+                headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+            )
+            await response(scope, receive, send)
+            return
+
+        in_flight = ADMISSION_IN_FLIGHT.labels(rule.name)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            in_flight.dec()
+            limit.release()
+
+    def client_address(self, scope) -> str:
+        for key, value in scope.get("headers", ()):
+            if key != b"x-forwarded-for":
+                continue
+            if self.proxy_hops:
+                # Each trusted proxy appended the address it saw; earlier
+                # entries are whatever the client chose to send
+                hops = [hop.strip() for hop in value.decode("latin-1").split(",")]
+                return hops[max(len(hops) - self.proxy_hops, 0)]
+            if not self._warned_forwarded:
+                # Behind a proxy every client would share the proxy's buckets
+                self._warned_forwarded = True
+                client = scope.get("client")
+                logger.warning(
+                    "Requests carry X-Forwarded-For but RATE_LIMIT_PROXY_HOPS is 0, so rate limits "
+                    "apply per connecting address (%s); set it to the number of proxies in front of the app",
+                    client[0] if client else "unknown"
+                )
+            break
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    def _take_token(self, rule: Rule, client: str) -> float:
+        """Spend one token; returns 0 on success, else the seconds until one is available"""
+        count, seconds = rule.rate
+        refill = count / seconds
+        now = time.monotonic()
+        key = (rule.name, client)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(count), now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(count, bucket[0] + (now - bucket[1]) * refill)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0
+        return (1 - bucket[0]) / refill
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def diff_leaderboard(old: List[dict], new: List[dict]) -> List[dict]:
+    """Changes that turn one top-N list into another
+
+    Entries are keyed by nickname (unique per claimed score). Clients apply the
+    ``remove`` operations first, then place every ``upsert`` at its rank.
+    """
+    old_by_name = {entry["nickname"]: entry for entry in old}
+    new_names = {entry["nickname"] for entry in new}
+    changes = [{"op": "remove", "nickname": name} for name in old_by_name if name not in new_names]
+    for entry in new:
+        if old_by_name.get(entry["nickname"]) != entry:
+            changes.append({"op": "upsert", "rank": entry["rank"], "entry": entry})
+    return changes
+
+
+class LeaderboardBroadcaster:
+    """Computes the top N once per change and fans deltas out to subscribers
+
+    Writes call ``notify_change``; changes arriving within ``debounce`` seconds
+    are coalesced into one recomputation. Each message is serialized once and
+    the same string is queued for every subscriber. Subscribers that fall
+    ``queue_size`` messages behind are dropped and get a fresh snapshot when
+    they reconnect.
+    """
+
+    def __init__(self, size: int, debounce: float, queue_size: int = 32):
+        self.size = size
+        self.debounce = debounce
+        self.queue_size = queue_size
+        self.version = 0
+        self.entries: List[dict] = []
+        self._loader: Optional[Callable[[], Awaitable[List[dict]]]] = None
+        self._subscribers = set()
+        self._changed = asyncio.Event()
+        self._stale = True
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def start(self, loader: Callable[[], Awaitable[List[dict]]]):
+        self._loader = loader
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for queue in list(self._subscribers):
+            self._drop(queue)
+
+    def notify_change(self):
+        """Mark the top N as possibly changed"""
+        self._stale = True
+        self._changed.set()
+
+    async def subscribe(self) -> asyncio.Queue:
+        """Register a subscriber; its queue starts with a full snapshot"""
+        if self._stale:
+            await self._refresh()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        queue.put_nowait(self._message("snapshot", leaderboard=self.entries))
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    async def _run(self):
+        while True:
+            await self._changed.wait()
+            await asyncio.sleep(self.debounce)
+            self._changed.clear()
+            # Nobody is listening; the next subscriber triggers the load
+            if not self._subscribers:
+                continue
+            try:
+                await self._refresh()
+            except Exception as e:
+                logger.warning("Could not refresh pushed leaderboard: %s", e)
+
+    async def _refresh(self):
+        async with self._lock:
+            if not self._stale:
+                return
+            self._stale = False
+            try:
+                entries = await self._loader()
+            except Exception:
+                self._stale = True
+                raise
+            changes = diff_leaderboard(self.entries, entries)
+            self.entries = entries
+            if changes:
+                self.version += 1
+                self._publish(self._message("delta", changes=changes))
+
+    def _message(self, kind: str, **fields) -> str:
+        return json.dumps({"type": kind, "version": self.version, **fields})
+
+    def _publish(self, message: str):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                logger.info("Dropping slow leaderboard subscriber")
+                self._drop(queue)
+
+    def _drop(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+        # None tells the connection handler to close; make room for it if needed
+        while True:
+            try:
+                queue.put_nowait(None)
+                return
+            except asyncio.QueueFull:
+                queue.get_nowait()
+
+
+leaderboard_broadcaster = LeaderboardBroadcaster(
+    size=int(os.getenv("LEADERBOARD_PUSH_SIZE", "10")),
+    debounce=float(os.getenv("LEADERBOARD_PUSH_DEBOUNCE", "0.2")),
+)
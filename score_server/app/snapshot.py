@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import os
+
+from .database import database
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotRefresher:
+    """Background task that keeps the leaderboard snapshot fresh
+
+    Refreshes every ``interval`` seconds, or sooner once this worker has seen
+    ``max_writes`` score writes. Every worker runs one, but a refresh is skipped
+    when another worker holds the refresh lock or refreshed within the
+    interval, so the view is rebuilt about once per interval overall.
+    """
+
+    def __init__(self, db, interval: float, max_writes: int):
+        self.db = db
+        self.interval = interval
+        self.max_writes = max_writes
+        # Timer refreshes are skipped while the snapshot is younger than half an
+        # interval, so data served is at most this old (plus any cache TTL)
+        self.max_staleness = interval * 1.5
+        self._writes = 0
+        self._wake = asyncio.Event()
+
+    def note_write(self):
+        """Count a score write, waking the refresher once enough have piled up"""
+        self._writes += 1
+        if self._writes >= self.max_writes:
+            self._wake.set()
+
+    async def run(self):
+        # Populate straight away so a fresh deployment has something to serve
+        await self._refresh(max_age=self.interval / 2)
+        while True:
+            forced = False
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+                forced = True
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            self._writes = 0
+            await self._refresh(max_age=None if forced else self.interval / 2)
+
+    async def _refresh(self, max_age: float = None):
+        try:
+            if await self.db.refresh_leaderboard_snapshot(max_age):
+                logger.debug("Leaderboard snapshot refreshed")
+        except Exception as e:
+            logger.warning("Could not refresh leaderboard snapshot: %s", e)
+
+
+snapshot_refresher = SnapshotRefresher(
+    database,
+    interval=float(os.getenv("LEADERBOARD_SNAPSHOT_INTERVAL", "10")),
+    max_writes=int(os.getenv("LEADERBOARD_SNAPSHOT_WRITES", "100")),
+)
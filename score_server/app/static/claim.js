@@ -0,0 +1,82 @@
+// Per-session values are rendered into data attributes on <body>
+const { sessionId, savings } = document.body.dataset;
+
+// Check if this is a high score
+fetch('/api/check-high-score/' + encodeURIComponent(sessionId))
+    .then(response => response.json())
+    .then(data => {
+        if (data.is_high_score) {
+            document.getElementById('highScoreCheck').innerHTML =
+                `<div class="high-score">🏆 HIGH SCORE! You saved ${savings}!<br>
+                Rank #${data.rank} out of ${data.total_scores} players!</div>`;
+        }
+    })
+    .catch(err => console.log('Could not check high score status'));
+
+// Live nickname availability check while typing
+let nicknameTimer = null;
+document.getElementById('nickname').addEventListener('input', (e) => {
+    clearTimeout(nicknameTimer);
+    const status = document.getElementById('nicknameStatus');
+    const nickname = e.target.value.trim();
+    if (nickname.length < 2) {
+        status.textContent = '';
+        return;
+    }
+    nicknameTimer = setTimeout(async () => {
+        try {
+            const params = new URLSearchParams({ nickname: nickname, session_id: sessionId });
+            const response = await fetch('/api/nickname-available?' + params);
+            const data = await response.json();
+            if (e.target.value.trim() !== nickname) return;
+            status.textContent = data.available ? '✅ Available' : '❌ ' + data.reason;
+            status.style.color = data.available ? '#28a745' : '#721c24';
+        } catch (err) {
+            status.textContent = '';
+        }
+    }, 300);
+});
+
+function resetButton(submitBtn) {
+    submitBtn.disabled = false;
+    submitBtn.querySelector('.loading').style.display = 'none';
+    submitBtn.querySelector('.normal').style.display = 'inline';
+}
+
+document.getElementById('claimForm').addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const email = document.getElementById('email').value;
+    const nickname = document.getElementById('nickname').value;
+    const messageDiv = document.getElementById('message');
+    const submitBtn = document.getElementById('submitBtn');
+
+    // Show loading state
+    submitBtn.disabled = true;
+    submitBtn.querySelector('.loading').style.display = 'inline';
+    submitBtn.querySelector('.normal').style.display = 'none';
+
+    try {
+        const response = await fetch('/api/claim/' + encodeURIComponent(sessionId), {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ email: email, nickname: nickname })
+        });
+
+        const data = await response.json();
+
+        if (response.ok) {
+            let message = '<div class="success">✅ Score claimed successfully!</div>';
+            if (data.is_high_score) {
+                message += `<div class="high-score">🎉 High Score Confirmed! You ranked #${data.rank}!</div>`;
+            }
+            messageDiv.innerHTML = message;
+            document.getElementById('claimSection').style.display = 'none';
+        } else {
+            messageDiv.innerHTML = '<div class="error">❌ ' + data.detail + '</div>';
+            resetButton(submitBtn);
+        }
+    } catch (err) {
+        messageDiv.innerHTML = '<div class="error">❌ Error claiming score. Please try again.</div>';
+        resetButton(submitBtn);
+    }
+});
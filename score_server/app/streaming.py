@@ -0,0 +1,85 @@
+import csv
+import io
+from typing import Any, AnyStr, AsyncIterator, Iterable, Tuple
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+
+# Rows are buffered into chunks of this many before being written to the socket
+CHUNK_ROWS = 500
+
+
+async def prime(rows: AsyncIterator) -> Tuple[Any, AsyncIterator]:
+    """Start an async row iterator now so query errors surface before the response
+
+    Returns the first row (or None) and an iterator that yields the
+    already-fetched first row followed by the rest.
+    """
+    try:
+        first = await rows.__anext__()
+    except StopAsyncIteration:
+        await rows.aclose()
+        return None, _empty()
+    return first, _chain(first, rows)
+
+
+async def _empty():
+    return
+    yield
+
+
+async def _chain(first, rows: AsyncIterator):
+    try:
+        yield first
+        async for row in rows:
+            yield row
+    finally:
+        # Release the database connection promptly if the client disconnects
+        await rows.aclose()
+
+
+async def chunked(parts: AsyncIterator[AnyStr], size: int = CHUNK_ROWS) -> AsyncIterator[AnyStr]:
+    """Join small string or bytes parts into larger chunks for fewer socket writes"""
+    buffer = []
+    async for part in parts:
+        buffer.append(part)
+        if len(buffer) >= size:
+            yield buffer[0][:0].join(buffer)
+            buffer = []
+    if buffer:
+        yield buffer[0][:0].join(buffer)
+
+
+def csv_line(values: Iterable) -> bytes:
+    """Render one CSV record as UTF-8"""
+    out = io.StringIO()
+    csv.writer(out).writerow(values)
+    return out.getvalue().encode()
+
+
+
+class _StreamSafeGZipResponder(GZipResponder):
+    async def send_with_gzip(self, message):
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            if content_type.startswith("text/event-stream"):
+                # Reuse the pass-through path for already-encoded bodies
+                self.initial_message = message
+                self.content_encoding_set = True
+                return
+        await super().send_with_gzip(message)
+
+
+class StreamSafeGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves Server-Sent Events uncompressed
+
+    The gzip writer buffers small writes, which would hold SSE messages back
+    until enough of them had piled up.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("accept-encoding", ""):
+            responder = _StreamSafeGZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -0,0 +1,76 @@
+"""Compare two benchmark result files
+
+    python -m bench.compare bench/results/BASE.json bench/results/NEW.json
+
+Exits with status 1 when an operation's p95 latency grew by more than
+--threshold, or it now needs more database round trips.
+"""
+import argparse
+import json
+import sys
+
+
+def change(old, new):
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old
+
+
+def fmt_change(value):
+    return "" if value is None else f"{value:+.0%}"
+
+
+def compare(base, new, threshold):
+    """Print a per-operation comparison and return the regressions found"""
+    regressions = []
+    for name, scenario in new["scenarios"].items():
+        base_ops = base["scenarios"].get(name, {}).get("ops", {})
+        print(f"\n== {name}")
+        print(f"{'op':<18}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}{'rps':>16}{'trips':>12}")
+        for op, stats in scenario["ops"].items():
+            old = base_ops.get(op)
+            if old is None:
+                print(f"{op:<18}(new)")
+                continue
+            cells = []
+            for key in ("p50", "p95", "p99"):
+                o, n = old["latency_ms"][key], stats["latency_ms"][key]
+                cells.append(f"{n} {fmt_change(change(o, n)):>5}")
+            o, n = old["throughput_rps"], stats["throughput_rps"]
+            cells.append(f"{n} {fmt_change(change(o, n)):>5}")
+            trips = f"{old['round_trips']}->{stats['round_trips']}"
+            print(f"{op:<18}" + "".join(f"{c:>16}" for c in cells) + f"{trips:>12}")
+
+            p95 = change(old["latency_ms"]["p95"], stats["latency_ms"]["p95"])
+            if p95 is not None and p95 > threshold:
+                regressions.append(f"{name}/{op}: p95 {fmt_change(p95)}")
+            if None not in (old["round_trips"], stats["round_trips"]) and stats["round_trips"] > old["round_trips"]:
+                regressions.append(f"{name}/{op}: round trips {old['round_trips']} -> {stats['round_trips']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed p95 growth (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"base: {base['meta']['commit']} ({base['meta']['started_at']})")
+    print(f"new:  {new['meta']['commit']} ({new['meta']['started_at']})")
+
+    regressions = compare(base, new, args.threshold)
+    if regressions:
+        print("\nRegressions:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
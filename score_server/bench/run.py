@@ -0,0 +1,390 @@
+"""Drive mixed workloads against the score server and record latencies
+
+    python -m bench.run --scenario all --requests 2000 --concurrency 50
+
+By default the app is started in-process against BENCH_DATABASE_URL, which
+also lets every request count its database round trips. Pass --url to load
+an already running server instead (round trips are then not reported).
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import platform
+import secrets
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from .seed import DEFAULT_URL
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ["submit_burst", "claim_storm", "leaderboard_poll", "export", "mixed"]
+BENCH_ADMIN_KEY = "bench-admin-key"
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# Round-trip counter of the request being served, read by the query logger
+_request_trips = contextvars.ContextVar("request_trips", default=None)
+
+
+class TripCounter:
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+
+def count_query(record):
+    """asyncpg query logger: attribute one round trip to the current request"""
+    counter = _request_trips.get()
+    if counter is not None:
+        counter.count += 1
+
+
+class RoundTripApp:
+    """ASGI wrapper that gives each request its own TripCounter
+
+    The counter is registered under the request's ``x-bench-id`` header so
+    the driver can pick it up once the response is complete.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.counters = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            headers = dict(scope["headers"])
+            bench_id = headers.get(b"x-bench-id")
+            if bench_id is not None:
+                counter = TripCounter()
+                self.counters[bench_id.decode()] = counter
+                _request_trips.set(counter)
+        await self.app(scope, receive, send)
+
+
+class OpStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+        self.counters = []
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Times requests per operation and summarizes them"""
+
+    def __init__(self, client, server=None):
+        self.client = client
+        self.server = server
+        self.ops = {}
+        self._ids = 0
+
+    async def request(self, op, method, url, ok=(200,), **kwargs):
+        stats = self.ops.setdefault(op, OpStats())
+        self._ids += 1
+        bench_id = str(self._ids)
+        headers = kwargs.pop("headers", {})
+        headers["x-bench-id"] = bench_id
+
+        started = time.perf_counter()
+        try:
+            async with self.client.stream(method, url, headers=headers, **kwargs) as response:
+                body = await response.aread()
+        except httpx.HTTPError as e:
+            stats.errors += 1
+            logger.debug(f"{op} failed: {e}")
+            return None, None
+        stats.latencies.append(time.perf_counter() - started)
+
+        stats.statuses[response.status_code] = stats.statuses.get(response.status_code, 0) + 1
+        if response.status_code not in ok:
+            stats.errors += 1
+        if self.server is not None:
+            counter = self.server.counters.pop(bench_id, None)
+            if counter is not None:
+                stats.counters.append(counter)
+        return response, body
+
+    def summary(self, elapsed):
+        result = {}
+        for op, stats in sorted(self.ops.items()):
+            latencies = sorted(stats.latencies)
+            ms = lambda value: round(value * 1000, 2) if value is not None else None
+            trips = [counter.count for counter in stats.counters]
+            result[op] = {
+                "count": len(latencies),
+                "errors": stats.errors,
+                "statuses": {str(code): n for code, n in sorted(stats.statuses.items())},
+                "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+                "latency_ms": {
+                    "p50": ms(percentile(latencies, 0.50)),
+                    "p95": ms(percentile(latencies, 0.95)),
+                    "p99": ms(percentile(latencies, 0.99)),
+                    "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+                    "max": ms(latencies[-1]) if latencies else None,
+                },
+                "round_trips": round(sum(trips) / len(trips), 2) if trips else None,
+            }
+        return result
+
+
+async def run_concurrently(concurrency, jobs):
+    """Run coroutine factories with at most ``concurrency`` in flight"""
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    async def worker():
+        while not queue.empty():
+            job = queue.get_nowait()
+            await job()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+class Workload:
+    """The requests players, kiosks and admins make, parameterized per run"""
+
+    def __init__(self, recorder, run_id):
+        self.recorder = recorder
+        self.run_id = run_id
+        self.submitted = []
+        self._next = 0
+
+    async def submit(self):
+        self._next += 1
+        session_id = f"bench-{self.run_id}-{self._next}"
+        savings = secrets.randbelow(20000)
+        response, _ = await self.recorder.request("submit", "POST", "/api/scores", json={
+            "session_id": session_id,
+            "final_bill": 20000 - savings,
+            "total_savings": savings,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        })
+        if response is not None and response.status_code == 200:
+            self.submitted.append(session_id)
+
+    async def claim(self):
+        """Scan the QR code, check the score, then claim it"""
+        if not self.submitted:
+            return
+        session_id = self.submitted.pop()
+        suffix = session_id.rsplit("-", 1)[1]
+        await self.recorder.request("claim_page", "GET", f"/claim/{session_id}")
+        await self.recorder.request("check_high_score", "GET", f"/api/check-high-score/{session_id}")
+        await self.recorder.request("claim", "POST", f"/api/claim/{session_id}", json={
+            "email": f"bench-{self.run_id}-{suffix}@example.com",
+            "nickname": f"b{self.run_id}{suffix}",
+        })
+
+    async def poll_leaderboard(self):
+        """The display's top 10, and now and then a deeper page"""
+        response, body = await self.recorder.request("leaderboard_top", "GET", "/api/leaderboard?limit=10")
+        if response is None or response.status_code != 200 or secrets.randbelow(10):
+            return
+        cursor = json.loads(body).get("next_cursor")
+        if cursor:
+            await self.recorder.request(
+                "leaderboard_page", "GET", "/api/leaderboard", params={"limit": 50, "cursor": cursor}
+            )
+
+    async def export_scores(self, limit):
+        await self.recorder.request("all_scores", "GET", "/api/all-scores", params={"limit": limit})
+
+    async def export_emails(self, limit, admin_key):
+        await self.recorder.request(
+            "admin_emails", "GET", "/api/admin/emails",
+            params={"limit": limit, "format": "ndjson", "admin_key": admin_key},
+        )
+
+
+async def run_scenario(name, recorder, workload, args):
+    if name == "submit_burst":
+        await run_concurrently(args.concurrency, [workload.submit] * args.requests)
+    elif name == "claim_storm":
+        # Everyone who just played scans the QR code at the same moment
+        if len(workload.submitted) < args.requests:
+            await run_concurrently(args.concurrency, [workload.submit] * (args.requests - len(workload.submitted)))
+            recorder.ops.pop("submit", None)
+        await run_concurrently(args.concurrency, [workload.claim] * len(workload.submitted))
+    elif name == "leaderboard_poll":
+        await run_concurrently(args.concurrency, [workload.poll_leaderboard] * args.requests)
+    elif name == "export":
+        exports = max(1, args.requests // 100)
+        await run_concurrently(min(args.concurrency, 4), [
+            lambda: workload.export_scores(args.export_limit),
+            lambda: workload.export_emails(args.export_limit, args.admin_key),
+        ] * exports)
+    elif name == "mixed":
+        await run_mixed(workload, args)
+
+
+async def run_mixed(workload, args):
+    """Submissions, claims, leaderboard polling and exports all at once"""
+    deadline = time.monotonic() + args.duration
+
+    async def loop(action, pause):
+        while time.monotonic() < deadline:
+            await action()
+            if pause:
+                await asyncio.sleep(pause)
+
+    players = max(1, args.concurrency // 2)
+    pollers = max(1, args.concurrency // 4)
+    await asyncio.gather(
+        *(loop(workload.submit, 0) for _ in range(players)),
+        *(loop(workload.claim, 0.05) for _ in range(players)),
+        *(loop(workload.poll_leaderboard, 0) for _ in range(pollers)),
+        loop(lambda: workload.export_scores(args.export_limit), 1),
+        loop(lambda: workload.export_emails(args.export_limit, args.admin_key), 1),
+    )
+
+
+async def start_server(database_url, port):
+    """Start the app in this process, counting round trips per request"""
+    import uvicorn
+
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("ADMIN_KEY", BENCH_ADMIN_KEY)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # All load comes from one address; per-client limits would only measure 429s
+    for name in ("RATE_LIMIT_SUBMIT", "RATE_LIMIT_SUBMIT_BATCH", "RATE_LIMIT_ALL_SCORES"):
+        os.environ.setdefault(name, "0")
+    from app.database import database
+    from app.main import app
+
+    database.add_query_logger(count_query)
+    wrapped = RoundTripApp(app)
+    server = uvicorn.Server(uvicorn.Config(
+        wrapped, host="127.0.0.1", port=port, log_level="warning", lifespan="on"
+    ))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task, wrapped
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def describe_database(database_url):
+    import asyncpg
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        return {
+            "server_version": await conn.fetchval("SHOW server_version"),
+            # Planner estimate: an exact count takes seconds on 10M rows
+            "scores_rows": int(await conn.fetchval("""
+                SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)
+                FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'score_entries'::regclass
+            """)),
+        }
+    finally:
+        await conn.close()
+
+
+async def main_async(args):
+    server = task = wrapped = None
+    if args.url:
+        base_url = args.url
+    else:
+        server, task, wrapped = await start_server(args.database_url, args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    scenarios = SCENARIOS if args.scenario == "all" else [args.scenario]
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "in_process": server is not None,
+            "python": platform.python_version(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("admin_key", "database_url")},
+            "env": {k: v for k, v in os.environ.items() if k.startswith(("SCORE_", "LEADERBOARD_", "RANK_", "RATE_LIMIT_", "ADMISSION_"))},
+        },
+        "scenarios": {},
+    }
+    if server is not None:
+        results["meta"]["database"] = await describe_database(args.database_url)
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+            workload = Workload(None, secrets.token_hex(3))
+            for name in scenarios:
+                recorder = Recorder(client, wrapped)
+                workload.recorder = recorder
+                started = time.perf_counter()
+                await run_scenario(name, recorder, workload, args)
+                elapsed = time.perf_counter() - started
+                results["scenarios"][name] = {
+                    "duration_s": round(elapsed, 3),
+                    "ops": recorder.summary(elapsed),
+                }
+                print_summary(name, results["scenarios"][name])
+    finally:
+        if server is not None:
+            server.should_exit = True
+            await task
+
+    os.makedirs(args.out, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(args.out, f"{stamp}-{results['meta']['commit'] or 'nogit'}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {path}")
+
+
+def print_summary(name, scenario):
+    print(f"\n== {name} ({scenario['duration_s']}s)")
+    print(f"{'op':<18}{'count':>7}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'trips':>7}")
+    for op, s in scenario["ops"].items():
+        lat = s["latency_ms"]
+        trips = "-" if s["round_trips"] is None else s["round_trips"]
+        print(f"{op:<18}{s['count']:>7}{s['errors']:>6}{s['throughput_rps']:>9}"
+              f"{lat['p50']:>9}{lat['p95']:>9}{lat['p99']:>9}{trips:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=SCENARIOS + ["all"], default="all")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30, help="seconds for the mixed scenario")
+    parser.add_argument("--export-limit", type=int, default=10000, help="rows per export request")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", DEFAULT_URL))
+    parser.add_argument("--url", help="benchmark a running server instead of an in-process one")
+    parser.add_argument("--admin-key", default=os.getenv("ADMIN_KEY", BENCH_ADMIN_KEY))
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--out", default=RESULTS_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests that need Postgres run against this database and are skipped without it;
+# it is migrated on first use and rows are added to it, so don't point it at production
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+# app.database requires DATABASE_URL at import time
+os.environ.setdefault("DATABASE_URL", TEST_DATABASE_URL or "postgresql://localhost/inkless_test")
+
+
+@pytest.fixture
+def database_url(monkeypatch):
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    monkeypatch.setenv("DATABASE_URL", TEST_DATABASE_URL)
+    return TEST_DATABASE_URL
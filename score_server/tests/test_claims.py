@@ -0,0 +1,63 @@
+import asyncio
+import uuid
+
+from app.database import CLAIM_ALREADY_CLAIMED, CLAIM_NICKNAME_TAKEN, CLAIM_OK, Database
+
+
+async def connected():
+    db = Database()
+    await db.connect()
+    return db
+
+
+def test_concurrent_identical_claims_both_succeed(database_url):
+    async def scenario():
+        db = await connected()
+        try:
+            for _ in range(20):
+                session_id = uuid.uuid4().hex
+                nickname = f"racer-{session_id[:8]}"
+                await db.submit_score(session_id, 100, 50, "")
+                results = await asyncio.gather(
+                    db.claim_score(session_id, f"{nickname}@example.com", nickname),
+                    db.claim_score(session_id, f"{nickname}@example.com", nickname),
+                )
+                assert [result['status'] for result in results] == [CLAIM_OK, CLAIM_OK]
+        finally:
+            await db.disconnect()
+
+    asyncio.run(scenario())
+
+
+def test_nickname_taken_by_another_score(database_url):
+    async def scenario():
+        db = await connected()
+        try:
+            first, second = uuid.uuid4().hex, uuid.uuid4().hex
+            nickname = f"taken-{first[:8]}"
+            await db.submit_score(first, 100, 50, "")
+            await db.submit_score(second, 100, 60, "")
+            assert (await db.claim_score(first, "a@example.com", nickname))['status'] == CLAIM_OK
+            result = await db.claim_score(second, "b@example.com", nickname.upper())
+            assert result['status'] == CLAIM_NICKNAME_TAKEN
+        finally:
+            await db.disconnect()
+
+    asyncio.run(scenario())
+
+
+def test_repeated_claim_is_idempotent_but_other_details_conflict(database_url):
+    async def scenario():
+        db = await connected()
+        try:
+            session_id = uuid.uuid4().hex
+            nickname = f"again-{session_id[:8]}"
+            await db.submit_score(session_id, 100, 50, "")
+            assert (await db.claim_score(session_id, "a@example.com", nickname))['status'] == CLAIM_OK
+            assert (await db.claim_score(session_id, "a@example.com", nickname))['status'] == CLAIM_OK
+            result = await db.claim_score(session_id, "b@example.com", nickname)
+            assert result['status'] == CLAIM_ALREADY_CLAIMED
+        finally:
+            await db.disconnect()
+
+    asyncio.run(scenario())
@@ -0,0 +1,71 @@
+import asyncio
+import uuid
+
+from app.conditional import CLAIMS, SCORES, ChangeTracker
+from app.database import SCORE_EVENTS_CHANNEL, Database
+
+
+def tracked():
+    db = Database()
+    return db, ChangeTracker(db.change_position)
+
+
+def feed(db, tracker, payloads):
+    for payload in payloads:
+        db._on_notification(None, 0, SCORE_EVENTS_CHANNEL, f"{payload}:elsewhere")
+        tracker.note_change(claim=payload.startswith("c:"))
+
+
+def test_trackers_fed_the_same_events_agree():
+    first, second = tracked(), tracked()
+    feed(*first, ["i:10:50", "i:11:70", "c:10:50"])
+    # Commit order can differ from ID order, and workers hear events in commit order
+    feed(*second, ["i:11:70", "i:10:50", "c:10:50"])
+    for kind in (SCORES, CLAIMS):
+        assert first[1].current(kind).tag == second[1].current(kind).tag
+
+
+def test_late_committed_score_changes_the_tag():
+    db, tracker = tracked()
+    feed(db, tracker, ["i:11:70"])
+    before = tracker.current(SCORES).tag
+    feed(db, tracker, ["i:10:50"])
+    assert tracker.current(SCORES).tag != before
+
+
+def test_claims_change_both_tags():
+    db, tracker = tracked()
+    feed(db, tracker, ["i:10:50"])
+    before = {kind: tracker.current(kind).tag for kind in (SCORES, CLAIMS)}
+    feed(db, tracker, ["i:11:70"])
+    assert tracker.current(CLAIMS).tag == before[CLAIMS]
+    feed(db, tracker, ["c:11:70"])
+    assert all(tracker.current(kind).tag != tag for kind, tag in before.items())
+
+
+def test_workers_agree_on_tags(database_url):
+    async def scenario():
+        writer, peer = Database(), Database()
+        await writer.connect()
+        await peer.connect()
+        late = None
+        try:
+            session_id = uuid.uuid4().hex
+            await writer.submit_score(session_id, 100, 50, "")
+            await writer.claim_score(session_id, f"{session_id}@example.com", f"tag-{session_id[:8]}")
+            for _ in range(50):
+                if peer.change_position() == writer.change_position():
+                    break
+                await asyncio.sleep(0.1)
+            # A worker started later loads the same position from the database
+            late = Database()
+            await late.connect()
+            trackers = [ChangeTracker(db.change_position) for db in (writer, peer, late)]
+            for kind in (SCORES, CLAIMS):
+                assert len({tracker.current(kind).tag for tracker in trackers}) == 1
+        finally:
+            for db in (late, peer, writer):
+                if db is not None:
+                    await db.disconnect()
+
+    asyncio.run(scenario())
@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.database import Database
+
+
+async def drop_partition(conn, name):
+    if await conn.fetchval("SELECT to_regclass($1)", name) is not None:
+        await conn.execute(f'ALTER TABLE score_entries DETACH PARTITION "{name}"')
+        await conn.execute(f'DROP TABLE "{name}"')
+
+
+def test_day_with_rows_in_default_partition_is_skipped(database_url):
+    async def scenario():
+        db = Database()
+        await db.connect()
+        try:
+            stuck = datetime.utcnow().date() + timedelta(days=db.partition_days_ahead + 1)
+            after = stuck + timedelta(days=1)
+            names = [f"scores_p{day:%Y%m%d}" for day in (stuck, after)]
+            async with db.acquire() as conn:
+                for name in names:
+                    await drop_partition(conn, name)
+                await conn.execute("""
+                    INSERT INTO score_entries (session_id, final_bill, total_savings, timestamp)
+                    VALUES ('default-partition-test', 100, 50, $1)
+                """, datetime.combine(stuck, datetime.min.time()))
+            try:
+                db.partition_days_ahead += 2
+                await db.ensure_partitions()
+                async with db.acquire() as conn:
+                    assert await conn.fetchval("SELECT to_regclass($1)", names[0]) is None
+                    assert await conn.fetchval("SELECT to_regclass($1)", names[1]) is not None
+                    assert await conn.fetchval(
+                        "SELECT COUNT(*) FROM scores_default WHERE session_id = 'default-partition-test'"
+                    ) == 1
+            finally:
+                async with db.acquire() as conn:
+                    await conn.execute("DELETE FROM score_entries WHERE session_id = 'default-partition-test'")
+                    await drop_partition(conn, names[1])
+        finally:
+            await db.disconnect()
+
+    asyncio.run(scenario())
+
+
+def test_archiving_resyncs_other_workers(database_url):
+    async def scenario():
+        archiver, peer = Database(), Database()
+        await archiver.connect()
+        await peer.connect()
+        resynced = asyncio.Event()
+
+        async def on_resync():
+            resynced.set()
+
+        peer.on_resync(on_resync)
+        day = datetime(2001, 1, 1)
+        name = f"scores_p{day:%Y%m%d}"
+        try:
+            async with archiver.acquire() as conn:
+                await conn.execute("SELECT create_score_partition($1)", day.date())
+                await conn.execute("""
+                    INSERT INTO score_entries (session_id, final_bill, total_savings, timestamp)
+                    VALUES ('archive-test', 100, 50, $1)
+                """, day)
+            # The archiver's own insert event reaches the peer's rank index
+            for _ in range(50):
+                if peer.rank_index.total == archiver.rank_index.total:
+                    break
+                await asyncio.sleep(0.1)
+            before = peer.rank_index.total
+            detached, _ = await archiver.archive_partitions(day.date() + timedelta(days=1))
+            assert detached == [name]
+            await asyncio.wait_for(resynced.wait(), 5)
+            assert peer.rank_index.total == before - 1
+        finally:
+            async with archiver.acquire() as conn:
+                await drop_partition(conn, name)
+                await conn.execute(f'DROP TABLE IF EXISTS "archived_{name}"')
+            await peer.disconnect()
+            await archiver.disconnect()
+
+    asyncio.run(scenario())
@@ -0,0 +1,38 @@
+import asyncio
+import json
+import uuid
+
+
+def next_message(queue, timeout=5):
+    return asyncio.wait_for(queue.get(), timeout)
+
+
+def test_snapshot_refresh_pushes_claims_it_includes(database_url, monkeypatch):
+    from app import main
+    from app.models import ClaimData
+
+    monkeypatch.setattr(main.database, "snapshot_enabled", True)
+    # Only the refreshes this test makes
+    monkeypatch.setattr(main.snapshot_refresher, "interval", 3600)
+
+    async def scenario():
+        async with main.lifespan(main.app):
+            # A fresh database has no snapshot until the first refresh
+            await main.database.refresh_leaderboard_snapshot()
+            queue = await main.leaderboard_broadcaster.subscribe()
+            assert json.loads(await next_message(queue))["type"] == "snapshot"
+
+            session_id = uuid.uuid4().hex
+            nickname = f"top-{session_id[:8]}"
+            await main.database.submit_score(session_id, 1, 10**9, "")
+            await main.claim_score(session_id, ClaimData(email="top@example.com", nickname=nickname))
+            # The claim is not in the snapshot yet, so nothing changes
+            await asyncio.sleep(main.leaderboard_broadcaster.debounce * 3)
+            assert queue.empty()
+
+            assert await main.database.refresh_leaderboard_snapshot()
+            message = json.loads(await next_message(queue))
+            assert message["type"] == "delta"
+            assert nickname in json.dumps(message["changes"])
+
+    asyncio.run(scenario())
@@ -1,8 +1,28 @@
+interface ScoreSubmission {
+    session_id: string;
+    final_bill: number;
+    total_savings: number;
+    timestamp: string;
+}
+
+// Scores that could not be sent wait here, across reloads, until the server is reachable
+const PENDING_SCORES_KEY = 'inkless.pendingScores';
+// Scores per upload; the server accepts up to 500
+const PENDING_BATCH_SIZE = 100;
+// Backoff between upload attempts; each wait is randomized so kiosks don't retry in lockstep
+const RETRY_MIN_MS = 5000;
+const RETRY_MAX_MS = 5 * 60 * 1000;
+
 export class HighScoreManager {
     private apiUrl: string = 'http://localhost:8000';
+    private retryDelay: number = RETRY_MIN_MS;
+    private flushTimer: any = null;
+    private flushing: boolean = false;
 
     constructor() {
         console.log(`HighScoreManager initialized with API: ${this.apiUrl}`);
+        window.addEventListener('online', () => this.scheduleFlush(RETRY_MIN_MS));
+        this.scheduleFlush(RETRY_MIN_MS);
     }
 
     // Generate a random session ID
@@ -13,24 +33,34 @@ export class HighScoreManager {
 
     async submitScore(finalBill: number, totalSavings: number): Promise<any> {
     const sessionId = this.generateSessionId();
-    const timestamp = new Date().toISOString();
+    const submission: ScoreSubmission = {
+        session_id: sessionId,
+        final_bill: finalBill,
+        total_savings: totalSavings,
+        timestamp: new Date().toISOString()
+    };
 
+    let response: Response;
     try {
         console.log('Submitting score:', { sessionId, finalBill, totalSavings });
 
-        const response = await fetch(`${this.apiUrl}/api/scores`, {
+        response = await fetch(`${this.apiUrl}/api/scores`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({
-                session_id: sessionId,
-                final_bill: finalBill,
-                total_savings: totalSavings,
-                timestamp: timestamp
-            })
+            body: JSON.stringify(submission)
         });
+    } catch (error) {
+        // Offline or the server is unreachable: keep the score and send it later
+        return this.bufferScore(submission);
+    }
 
+    if (response.status >= 500 || response.status === 429) {
+        return this.bufferScore(submission);
+    }
+
+    try {
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
@@ -39,41 +69,19 @@ export class HighScoreManager {
         console.log('Score submission result:', result);
 
         if (result.success) {
-            // Try to get leaderboard, but handle errors gracefully
-            let isHighScore = false;
-            let playerRank = null;
-            
-            try {
-                const leaderboardResponse = await fetch(`${this.apiUrl}/api/leaderboard`);
-                if (leaderboardResponse.ok) {
-                    const leaderboard = await leaderboardResponse.json();
-                    
-                    // Check if leaderboard is an array
-                    if (Array.isArray(leaderboard) && leaderboard.length > 0) {
-                        const topTenPercent = Math.ceil(leaderboard.length * 0.1);
-                        const playerRankIndex = leaderboard.findIndex(entry => 
-                            entry.total_savings === totalSavings && 
-                            entry.final_bill === finalBill
-                        );
-                        
-                        if (playerRankIndex >= 0) {
-                            playerRank = playerRankIndex + 1;
-                            isHighScore = playerRank <= topTenPercent;
-                        }
-                    }
-                }
-            } catch (leaderboardError) {
-                console.warn('Could not fetch leaderboard:', leaderboardError);
-                // Continue without high score detection
-            }
+            // We're online again; send anything buffered while we weren't
+            this.scheduleFlush(0);
 
+            // The server ranks the score against every submission, ties included
             return {
                 success: true,
                 sessionId: sessionId,
                 claimUrl: `${this.apiUrl}/claim/${sessionId}`,
                 qrCodeUrl: `https://api.qrserver.com/v1/create-qr-code/?size=120x120&data=${encodeURIComponent(`${this.apiUrl}/claim/${sessionId}`)}`,
-                isHighScore: isHighScore,
-                rank: playerRank
+                isHighScore: result.is_high_score ?? false,
+                rank: result.rank ?? null,
+                percentile: result.percentile ?? null,
+                totalScores: result.total_scores ?? null
             };
         } else {
             return {
@@ -91,6 +99,106 @@ export class HighScoreManager {
     }
 }
 
+    // Number of scores waiting to be uploaded
+    pendingScoreCount(): number {
+        return this.loadPending().length;
+    }
+
+    private bufferScore(submission: ScoreSubmission): any {
+        console.warn('Score server unreachable, keeping score for later:', submission.session_id);
+        const pending = this.loadPending();
+        pending.push(submission);
+        this.savePending(pending);
+        this.scheduleFlush(this.retryDelay);
+        return {
+            success: false,
+            queued: true,
+            sessionId: submission.session_id,
+            error: 'Score saved offline'
+        };
+    }
+
+    private loadPending(): ScoreSubmission[] {
+        try {
+            return JSON.parse(window.localStorage.getItem(PENDING_SCORES_KEY) || '[]');
+        } catch (error) {
+            return [];
+        }
+    }
+
+    private savePending(pending: ScoreSubmission[]) {
+        try {
+            if (pending.length) {
+                window.localStorage.setItem(PENDING_SCORES_KEY, JSON.stringify(pending));
+            } else {
+                window.localStorage.removeItem(PENDING_SCORES_KEY);
+            }
+        } catch (error) {
+            console.error('Could not store pending scores:', error);
+        }
+    }
+
+    // Upload buffered scores after a random delay of up to maxDelay
+    private scheduleFlush(maxDelay: number) {
+        if (this.flushTimer !== null || this.loadPending().length === 0) {
+            return;
+        }
+        this.flushTimer = setTimeout(() => {
+            this.flushTimer = null;
+            this.flushPending();
+        }, Math.random() * maxDelay);
+    }
+
+    private async flushPending(): Promise<void> {
+        if (this.flushing) {
+            return;
+        }
+        const batch = this.loadPending().slice(0, PENDING_BATCH_SIZE);
+        if (batch.length === 0) {
+            return;
+        }
+
+        this.flushing = true;
+        try {
+            const response = await fetch(`${this.apiUrl}/api/scores/batch`, await this.encodeBatch(batch));
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const result = await response.json();
+            console.log(`Uploaded buffered scores: ${result.created} new, ${result.existing} already stored, ${result.invalid} invalid`);
+
+            // Every item has a final result (a resent score is reported as already
+            // stored), so the whole batch leaves the buffer
+            const sent: { [sessionId: string]: boolean } = {};
+            for (const submission of batch) {
+                sent[submission.session_id] = true;
+            }
+            this.savePending(this.loadPending().filter(submission => !sent[submission.session_id]));
+            this.retryDelay = RETRY_MIN_MS;
+        } catch (error) {
+            console.warn('Could not upload buffered scores:', error);
+            this.retryDelay = Math.min(this.retryDelay * 2, RETRY_MAX_MS);
+        } finally {
+            this.flushing = false;
+        }
+        this.scheduleFlush(this.retryDelay);
+    }
+
+    // Gzip the batch where the browser can; the server accepts either
+    private async encodeBatch(batch: ScoreSubmission[]): Promise<RequestInit> {
+        const json = JSON.stringify(batch);
+        const Compression = (window as any).CompressionStream;
+        if (!Compression) {
+            return { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: json };
+        }
+        const compressed = (new Blob([json]) as any).stream().pipeThrough(new Compression('gzip'));
+        return {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Content-Encoding': 'gzip' },
+            body: await new Response(compressed).blob()
+        };
+    }
+
     // Get current leaderboard
     async getLeaderboard(): Promise<any> {
         try {
@@ -104,4 +212,46 @@ export class HighScoreManager {
             return [];
         }
     }
+
+    // Histogram and percentile thresholds of all scores, without downloading them
+    async getScoreDistribution(buckets: number = 20): Promise<any> {
+        try {
+            const response = await fetch(`${this.apiUrl}/api/score-distribution?buckets=${buckets}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return await response.json();
+        } catch (error) {
+            console.error('Error fetching score distribution:', error);
+            return null;
+        }
+    }
+
+    // Receive live leaderboard updates instead of polling; returns a function that stops them
+    subscribeLeaderboard(onUpdate: (leaderboard: any[]) => void): () => void {
+        const socket = new WebSocket(`${this.apiUrl.replace(/^http/, 'ws')}/ws/leaderboard`);
+        let leaderboard: any[] = [];
+
+        socket.onmessage = (event) => {
+            const message = JSON.parse(event.data);
+            if (message.type === 'snapshot') {
+                leaderboard = message.leaderboard;
+            } else if (message.type === 'delta') {
+                for (const change of message.changes) {
+                    const nickname = change.op === 'remove' ? change.nickname : change.entry.nickname;
+                    leaderboard = leaderboard.filter(entry => entry.nickname !== nickname);
+                    if (change.op === 'upsert') {
+                        leaderboard.push(change.entry);
+                    }
+                }
+                leaderboard.sort((a, b) => a.rank - b.rank);
+            }
+            onUpdate(leaderboard);
+        };
+        socket.onerror = (error) => {
+            console.warn('Leaderboard connection error:', error);
+        };
+
+        return () => socket.close();
+    }
 }
\ No newline at end of file
@@ -177,6 +177,9 @@ private _createLives() {
         
         // Load QR code with session ID for unique tracking
         this._loadQRCodeWithSession(result.qrCodeUrl, sessionId, claimUrl);
+      } else if (result.queued) {
+        this.line4Text.setText("Score saved offline");
+        this.line5Text.setText("It will be sent when the connection is back");
       } else {
         this.line4Text.setText("Score submission failed");
         this.line5Text.setText("Please try again later");